@@ -161,6 +161,8 @@ class GSFile:
 
         self.bones = []
         self.texList = []
+        self.texNames = {}
+        self.texCount = 0
         self.noeMaterials = NoeModelMaterials([], [])
 
     def check(self):
@@ -187,7 +189,8 @@ class GSFile:
         self.bones = skelMdlList[0].bones
         return True
 
-    def loadTextures(self):
+    def loadTextures(self, ids=None):
+        # decode the textures of the given ids (all by default) from the first TPL found
         if tpl and textures:
             name = rapi.getExtensionlessName(rapi.getInputName())
             tplFiles = [name + '.tpl']
@@ -208,7 +211,7 @@ class GSFile:
                     with open(tplFile, 'rb') as texFile:
                         data = texFile.read()
                         if fmt_wii_tpl.noepyCheckType(data):
-                            fmt_wii_tpl.noepyLoadRGBA(data, self.texList)
+                            tplData = fmt_wii_tpl.TPLFile(data)
                             name = tplFile
                             break
                 except IOError:
@@ -216,8 +219,12 @@ class GSFile:
             else:
                 return False
 
-            for i in range(len(self.texList)):
-                self.texList[i].name = rapi.getExtensionlessName(rapi.getLocalFileName(name)) + '_' + str(i)
+            self.texCount = len(tplData)
+            ids = range(self.texCount) if ids is None else sorted(set(i for i in ids if i < self.texCount))
+            for i, tex in zip(ids, tplData.getTextures(ids)):
+                tex.name = rapi.getExtensionlessName(rapi.getLocalFileName(name)) + '_' + str(i)
+                self.texNames[i] = tex.name
+                self.texList.append(tex)
             return True
 
         return False
@@ -319,9 +326,10 @@ class GSFile:
                 print()
                 print()
 
-            self.loadTextures()
-            if len(self.texList) > maxTexId:
-                self.noeMaterials = NoeModelMaterials(self.texList, [NoeMaterial(x['_name'], self.texList[x['_tex'][0]['id']].name if x['_tex'] else 'no_texture') for x in self.materials])
+            # only the first texture of a material is used
+            self.loadTextures([x['_tex'][0]['id'] for x in self.materials if x['_tex']])
+            if self.texCount > maxTexId:
+                self.noeMaterials = NoeModelMaterials(self.texList, [NoeMaterial(x['_name'], self.texNames[x['_tex'][0]['id']] if x['_tex'] else 'no_texture') for x in self.materials])
 
         # meshes
         if addrs[5]:
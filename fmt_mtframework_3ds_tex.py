@@ -16,6 +16,12 @@ import noesis
 import os
 import subprocess
 
+# RGB8 textures need nintex; ETC1 ones load without it
+try:
+    import lib_zq_nintendo_tex as nintex
+except ImportError:
+    nintex = None
+
 
 def readMagic(bs, length = 4):
     try:
@@ -49,11 +55,12 @@ def noepyLoadRGBA(data, texList):
         return 0
 
     if header['format'] == 0x11:
-        width = round(header['width'], 8)
-        height = round(header['height'], 8)
-        tex = bs.getBuffer(bs.tell(), bs.tell() + width * height * 3)
-        tex = unswizzle(tex, width, height)
-        texList.append(NoeTexture("default", width, height, tex, noesis.NOESISTEX_RGB24))
+        if nintex is None:
+            print("RGB8 textures require lib_zq_nintendo_tex.py!")
+            return 0
+        # RGB8 has no alpha, keep it RGB24
+        tex = nintex.readPICATexture(bs, header['width'], header['height'], nintex.NINTEX_PICA_RGB8)
+        texList.append(NoeTexture("default", tex.width, tex.height, nintex.rgbaToRGB(tex.pixelData), noesis.NOESISTEX_RGB24))
 
     elif header['format'] == 0xB or header['format'] == 0xC:
         width = round(header['width'], 4)
@@ -114,26 +121,3 @@ def readHeader(bs):
 
     return res
 
-
-def unswizzle(buffer, width, height):
-    bpp = 24
-    l = 8
-    m = 4
-    s = 2
-    stripSize = bpp * s // 8
-
-    result = bytearray(width * height * bpp // 8)
-    ptr = 0
-
-    for y in range(0, height, l):
-        for x in range(0, width, l):
-            for y1 in range(0, l, m):
-                for x1 in range(0, l, m):
-                    for y2 in range(0, m, s):
-                        for x2 in range(0, m, s):
-                            for y3 in range(s):
-                                idx = (((y + y1 + y2 + y3) * width) + x + x1 + x2) * bpp // 8
-                                result[idx : idx+stripSize] = buffer[ptr : ptr+stripSize]
-                                ptr += stripSize
-
-    return result
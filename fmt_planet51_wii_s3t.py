@@ -7,6 +7,7 @@ from inc_noesis import *
 import noesis
 import rapi
 import os
+import struct
 import lib_zq_nintendo_tex as nintex
 
 
@@ -17,11 +18,20 @@ def registerNoesisTypes():
     return 1
 
 
+# dataFormat, width, height
+checkHeader = struct.Struct('>III')
+
+
 def noepyCheckType(data):
-    bs = NoeBitStream(data, NOE_BIGENDIAN)
-    header = readHeader(bs)
-    return header['dataFormat'] in nintex.dataFormats and \
-        nintex.getTextureSizeInBytes(header['width'], header['height'], header['dataFormat']) + 0x20 <= bs.getSize()
+    # only looks at the first words of the header
+    if len(data) < 0x20:
+        return False
+    dataFormat, width, height = checkHeader.unpack_from(data)
+    if dataFormat not in nintex.dataFormats or nintex.dataFormats[dataFormat][6]:
+        return False
+    if not (0 < width <= nintex.NINTEX_MAX_SIZE and 0 < height <= nintex.NINTEX_MAX_SIZE):
+        return False
+    return nintex.getTextureSizeInBytes(width, height, dataFormat) + 0x20 <= len(data)
     # and always 4 mipmaps?
 
 
@@ -7,6 +7,7 @@ from inc_noesis import *
 import noesis
 import rapi
 import os
+import struct
 import lib_zq_nintendo_tex as nintex
 
 
@@ -24,10 +25,20 @@ def registerNoesisTypes():
     return 1
 
 
+# width, height, unk1, mips, dataFormat, unk2, unk3, size at 0x80
+checkHeader = struct.Struct('>HHBBBBII')
+
+
 def noepyCheckType(data):
-    bs = NoeBitStream(data, NOE_BIGENDIAN)
-    header = readHeader(bs)
-    return header['dataFormat'] in nintex.dataFormats and header['size'] + 0x90 <= bs.getSize()
+    # only looks at the end of the header
+    if len(data) < 0x90:
+        return False
+    width, height, unk1, mips, dataFormat, unk2, unk3, size = checkHeader.unpack_from(data, 0x80)
+    if dataFormat not in nintex.dataFormats or nintex.dataFormats[dataFormat][6]:
+        return False
+    if not (0 < width <= nintex.NINTEX_MAX_SIZE and 0 < height <= nintex.NINTEX_MAX_SIZE):
+        return False
+    return nintex.getTextureSizeInBytes(width, height, dataFormat) <= size and size + 0x90 <= len(data)
 
 
 def noepyLoadRGBA(data, texList):
@@ -39,6 +50,12 @@ def noepyLoadRGBA(data, texList):
     return len(texList)
 
 
+def readMipChain(data):
+    bs = NoeBitStream(data, NOE_BIGENDIAN)
+    header = readHeader(bs)
+    return nintex.readMipChain(bs, header['width'], header['height'], header['dataFormat'], header['mips'])
+
+
 def readHeader(bs):
     return {
         'unks': [bs.readUInt() for i in range(15)],
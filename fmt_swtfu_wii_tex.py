@@ -7,6 +7,7 @@ from inc_noesis import *
 import noesis
 import rapi
 import os
+import struct
 import lib_zq_nintendo_tex as nintex
 
 
@@ -17,10 +18,20 @@ def registerNoesisTypes():
     return 1
 
 
+# version, width, height, size
+checkHeader = struct.Struct('>IIII')
+
+
 def noepyCheckType(data):
-    bs = NoeBitStream(data, NOE_BIGENDIAN)
-    header = readHeader(bs)
-    return header['version'] in versions and header['size'] + 0x20 <= bs.getSize()
+    # only looks at the first words of the header
+    if len(data) < 0x20:
+        return False
+    version, width, height, size = checkHeader.unpack_from(data)
+    if version not in versions:
+        return False
+    if not (0 < width <= nintex.NINTEX_MAX_SIZE and 0 < height <= nintex.NINTEX_MAX_SIZE):
+        return False
+    return nintex.getTextureSizeInBytes(width, height, versions[version]) <= size and size + 0x20 <= len(data)
 
 
 versions = {
@@ -38,6 +49,12 @@ def noepyLoadRGBA(data, texList):
     return len(texList)
 
 
+def readMipChain(data):
+    bs = NoeBitStream(data, NOE_BIGENDIAN)
+    header = readHeader(bs)
+    return nintex.readMipChain(bs, header['width'], header['height'], versions[header['version']], header['mipmaps'])
+
+
 def readHeader(bs):
     return {
         'version' : bs.readUInt(),
@@ -7,16 +7,29 @@
 
 from inc_noesis import *
 import noesis
+import rapi
+import hashlib
+import struct
 import lib_zq_nintendo_tex as nintex
 
 
 debug = 0
 
+# writer: data format, palette pixel format of C4/C8 and number of mip levels to generate (1 = no mips)
+writeFormat = nintex.NINTEX_RGB5A3
+writePaletteFormat = 2
+writeMipLevels = 1
+
+# decode images of TPLs of at least parallelMinSize bytes in parallelWorkers processes (0 = off)
+parallelWorkers = 0
+parallelMinSize = 0x100000
+
 
 def registerNoesisTypes():
     handle = noesis.register("Wii Texture Library", ".tpl")
     noesis.setHandlerTypeCheck(handle, noepyCheckType)
     noesis.setHandlerLoadRGBA(handle, noepyLoadRGBA)
+    noesis.setHandlerWriteRGBA(handle, noepyWriteRGBA)
     return 1
 
 
@@ -26,24 +39,157 @@ def noepyCheckType(data):
 
 
 def noepyLoadRGBA(data, texList):
-    bs = NoeBitStream(data, NOE_BIGENDIAN)
+    tpl = TPLFile(data)
+    texList.extend(tpl.getTextures())
+    return len(texList)
 
-    magic = bs.readUInt()
-    count = bs.readUInt()
-    imageTblAddr = bs.readUInt()
 
-    bs.seek(imageTblAddr)
-    data = [{
-        'imageDataAddr':  bs.readUInt(),
-        'imagePaletteAddr': bs.readUInt()
-    } for i in range(count)]
+def noepyWriteRGBA(data, width, height, bs):
+    writeTPL(bs.writeBytes, [(data, width, height)])
+    return 1
 
-    for x in data:
-        paletteBuffer = None
-        paletteFormat = None
 
-        if x['imagePaletteAddr']:
-            bs.seek(x['imagePaletteAddr'])
+def align(x, y=0x20):
+    return (x + y - 1) // y * y
+
+
+def getMipImages(data, width, height, levels):
+    # (data, width, height) of each mip level, every level resampled from the one above
+    res = [(data, width, height)]
+    for offset, w, h in nintex.getMipChain(width, height, nintex.NINTEX_RGBA32, levels)[1:]:
+        data, width, height = res[-1]
+        res.append((rapi.imageResample(data, width, height, w, h), w, h))
+    return res
+
+
+def writeTPL(write, images, dataFormat=None, mipLevels=None, paletteFormat=None):
+    # Encode RGBA32 images into a TPL. images are (data, width, height[, dataFormat[, mipLevels]]) tuples,
+    # missing values default to the arguments, then to the write* options.
+    # write is called with consecutive chunks (a file's write, NoeBitStream.writeBytes...); the layout is
+    # known up front, so one image at a time is encoded and nothing is seeked back to.
+    dataFormat = writeFormat if dataFormat is None else dataFormat
+    mipLevels = writeMipLevels if mipLevels is None else mipLevels
+    paletteFormat = writePaletteFormat if paletteFormat is None else paletteFormat
+
+    entries = []
+    for x in images:
+        data, width, height = x[:3]
+        format = x[3] if len(x) > 3 and x[3] is not None else dataFormat
+        # before anything is written, so a bad format doesn't leave a truncated file
+        if not nintex.isEncodable(format):
+            raise ValueError("Data format not supported!")
+        levels = len(nintex.getMipChain(width, height, format, x[4] if len(x) > 4 and x[4] is not None else mipLevels))
+        entries.append({'data': data, 'width': width, 'height': height, 'format': format, 'levels': levels,
+                        'paletteSize': nintex.getPaletteSizeInBytes(format)})
+
+    # header, image table, palette headers, image headers, then palette and image data, 32-byte aligned
+    pos = 0x0C + 8 * len(entries)
+    for x in entries:
+        if x['paletteSize']:
+            x['paletteHeaderAddr'] = pos
+            pos += 0x0C
+    for x in entries:
+        x['imageHeaderAddr'] = pos
+        pos += 0x24
+    for x in entries:
+        if x['paletteSize']:
+            x['paletteAddr'] = pos = align(pos)
+            pos += x['paletteSize']
+        x['imageAddr'] = pos = align(pos)
+        pos += nintex.getMipChainSizeInBytes(x['width'], x['height'], x['format'], x['levels'])
+
+    res = bytearray(struct.pack('>III', 0x0020AF30, len(entries), 0x0C))
+    for x in entries:
+        res += struct.pack('>II', x['imageHeaderAddr'], x.get('paletteHeaderAddr', 0))
+    for x in entries:
+        if x['paletteSize']:
+            res += struct.pack('>HBBII', x['paletteSize'] // 2, 0, 0, paletteFormat, x['paletteAddr'])
+    for x in entries:
+        mips = x['levels'] > 1
+        res += struct.pack('>HHIIIIIIfBBBB', x['height'], x['width'], x['format'], x['imageAddr'],
+                           0, 0, 5 if mips else 1, 1, 0.0, 0, 0, x['levels'] - 1, 0)
+    write(bytes(res))
+    pos = len(res)
+
+    for x in entries:
+        palette = None
+        if x['paletteSize']:
+            palette = nintex.quantize(x['data'], x['width'], x['height'], x['format'], paletteFormat)
+            palette = bytes(palette[:x['paletteSize']]).ljust(x['paletteSize'], b'\0')
+            write(bytes(x['paletteAddr'] - pos) + palette)
+            pos = x['paletteAddr'] + len(palette)
+
+        write(bytes(x['imageAddr'] - pos))
+        pos = x['imageAddr']
+        for data, width, height in getMipImages(x['data'], x['width'], x['height'], x['levels']):
+            tex = nintex.writeTexture(data, width, height, x['format'], palette, paletteFormat)
+            write(bytes(tex))
+            pos += len(tex)
+
+
+def writeTPLFile(fileName, images, dataFormat=None, mipLevels=None, paletteFormat=None):
+    with open(fileName, 'wb') as f:
+        writeTPL(f.write, images, dataFormat, mipLevels, paletteFormat)
+
+
+class TPLFile:
+    # Header and image table of a TPL. Images are decoded by id on first access.
+    def __init__(self, data):
+        self.data = data
+        self.bs = NoeBitStream(data, NOE_BIGENDIAN)
+        bs = self.bs
+
+        self.magic = bs.readUInt()
+        self.count = bs.readUInt()
+        self.imageTblAddr = bs.readUInt()
+
+        bs.seek(self.imageTblAddr)
+        self.entries = [{
+            'imageDataAddr':  bs.readUInt(),
+            'imagePaletteAddr': bs.readUInt()
+        } for i in range(self.count)]
+
+        self.images = {}
+        self.palettes = {}  # by header address
+        self.paletteData = {}  # by format and content
+        self.textures = {}
+
+    def __len__(self):
+        return self.count
+
+    def getImage(self, id):
+        # image header
+        if id not in self.images:
+            bs = self.bs
+            bs.seek(self.entries[id]['imageDataAddr'])
+            self.images[id] = {
+                'height':        bs.readUShort(),
+                'width':         bs.readUShort(),
+                'format':        bs.readUInt(),
+                'addr':          bs.readUInt(),
+                'wrapS':         bs.readUInt(),
+                'wrapT':         bs.readUInt(),
+                'minFilter':     bs.readUInt(),
+                'magFilter':     bs.readUInt(),
+                'lodBias':       bs.readFloat(),
+                'edgeLodEnable': bs.readUByte(),
+                'minLod':        bs.readUByte(),
+                'maxLod':        bs.readUByte(),
+                'unpacked':      bs.readUByte(),
+            }
+        return self.images[id]
+
+    def getPalette(self, id):
+        # palette header and data, None if the image has no palette.
+        # Images with the same palette header, or the same palette data, share one buffer,
+        # so nintex expands it only once.
+        addr = self.entries[id]['imagePaletteAddr']
+        if not addr:
+            return None
+
+        if addr not in self.palettes:
+            bs = self.bs
+            bs.seek(addr)
             palette = {
                 'num':      bs.readUShort(),
                 'unpacked': bs.readUByte(),
@@ -51,35 +197,55 @@ def noepyLoadRGBA(data, texList):
                 'format':   bs.readUInt(),
                 'addr':     bs.readUInt()
             }
-            paletteBuffer = bs.getBuffer(palette['addr'], palette['addr'] + nintex.getPaletteSizeInBytes(palette['format'], palette['num']))
-            paletteFormat = palette['format']
-
-        bs.seek(x['imageDataAddr'])
-        image = {
-            'height':        bs.readUShort(),
-            'width':         bs.readUShort(),
-            'format':        bs.readUInt(),
-            'addr':          bs.readUInt(),
-            'wrapS':         bs.readUInt(),
-            'wrapT':         bs.readUInt(),
-            'minFilter':     bs.readUInt(),
-            'magFilter':     bs.readUInt(),
-            'lodBias':       bs.readFloat(),
-            'edgeLodEnable': bs.readUByte(),
-            'minLod':        bs.readUByte(),
-            'maxLod':        bs.readUByte(),
-            'unpacked':      bs.readUByte(),
-        }
+            buffer = bytes(bs.getBuffer(palette['addr'], palette['addr'] + nintex.getPaletteSizeInBytes(palette['format'], palette['num'])))
+            key = (palette['format'], hashlib.sha1(buffer).digest())
+            palette['buffer'] = self.paletteData.setdefault(key, buffer)
+            self.palettes[addr] = palette
+        return self.palettes[addr]
+
+    def getDescriptor(self, id):
+        # nintex.convert arguments of an image
+        image = self.getImage(id)
+        palette = self.getPalette(id)
 
         if debug:
-            print('image: {:#x}'.format(x['imageDataAddr']))
+            print('image: {:#x}'.format(self.entries[id]['imageDataAddr']))
             print(image)
-            print('palette: {:#x}'.format(x['imagePaletteAddr']))
-            if x['imagePaletteAddr']:
-                print(palette)
-
-        bs.seek(image['addr'])
-        tex = nintex.readTexture(bs, image['width'], image['height'], image['format'], paletteBuffer, paletteFormat)
-        texList.append(tex)
-
-    return len(texList)
+            print('palette: {:#x}'.format(self.entries[id]['imagePaletteAddr']))
+            if palette:
+                print(dict((k, v) for k, v in palette.items() if k != 'buffer'))
+
+        self.bs.seek(image['addr'])
+        size = nintex.getTextureSizeInBytes(image['width'], image['height'], image['format'])
+        return (nintex.getSourceView(self.bs, size), image['width'], image['height'], image['format'],
+                palette['buffer'] if palette else None, palette['format'] if palette else None)
+
+    def getSharedDescriptor(self, id):
+        # getDescriptor with the image data given by its offset in the file
+        descriptor = self.getDescriptor(id)
+        return (self.getImage(id)['addr'],) + descriptor[1:]
+
+    def getTexture(self, id):
+        if id not in self.textures:
+            self.textures[id] = nintex.readTextures([self.getDescriptor(id)])[0]
+        return self.textures[id]
+
+    def getTextures(self, ids=None):
+        # Textures of the given ids (all by default), decoding the missing ones as one batch
+        ids = range(self.count) if ids is None else ids
+        missing = [id for id in sorted(set(ids)) if id not in self.textures]
+        if parallelWorkers > 0 and len(self.data) >= parallelMinSize and len(missing) > 1:
+            textures = nintex.readTexturesParallel(self.data, [self.getSharedDescriptor(id) for id in missing], parallelWorkers)
+        else:
+            textures = nintex.readTextures([self.getDescriptor(id) for id in missing])
+        for id, tex in zip(missing, textures):
+            self.textures[id] = tex
+        return [self.textures[id] for id in ids]
+
+    def getMipChain(self, id):
+        # nintex.MipLevel list of an image: maxLod + 1 levels, decoded on access
+        image = self.getImage(id)
+        palette = self.getPalette(id)
+        self.bs.seek(image['addr'])
+        return nintex.readMipChain(self.bs, image['width'], image['height'], image['format'], image['maxLod'] + 1,
+                                   palette['buffer'] if palette else None, palette['format'] if palette else None)
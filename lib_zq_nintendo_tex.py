@@ -8,8 +8,33 @@
 
 from inc_noesis import *
 import rapi
-
-NINTEX_VERSION = 20180721
+import collections
+import functools
+import hashlib
+import os
+import struct
+import sys
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+except ImportError:
+    ProcessPoolExecutor = ThreadPoolExecutor = None
+    BrokenProcessPool = RuntimeError
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+NINTEX_VERSION = 20261017
 
 NINTEX_I4     = 0x00
 NINTEX_I8     = 0x01
@@ -23,6 +48,72 @@ NINTEX_C8     = 0x09
 NINTEX_C14X2  = 0x0A
 NINTEX_CMPR   = 0x0E
 
+# largest texture side GX can sample
+NINTEX_MAX_SIZE = 1024
+
+# 3DS (PICA200) texture formats, by their hardware codes
+NINTEX_PICA_RGBA8    = 0x0
+NINTEX_PICA_RGB8     = 0x1
+NINTEX_PICA_RGBA5551 = 0x2
+NINTEX_PICA_RGB565   = 0x3
+NINTEX_PICA_RGBA4    = 0x4
+NINTEX_PICA_LA8      = 0x5
+NINTEX_PICA_HILO8    = 0x6
+NINTEX_PICA_L8       = 0x7
+NINTEX_PICA_A8       = 0x8
+NINTEX_PICA_LA4      = 0x9
+NINTEX_PICA_L4       = 0xA
+NINTEX_PICA_A4       = 0xB
+
+# CMPR encoder quality tiers
+NINTEX_CMPR_FAST   = 0  # block bounding box
+NINTEX_CMPR_PCA    = 1  # principal axis of block colors
+NINTEX_CMPR_REFINE = 2  # principal axis, then least-squares endpoint refinement
+
+# Build the 16-bit lookup tables when the module is imported instead of on first use
+preloadTables = 0
+
+# Return CMPR textures as DXT1 and let Noesis decompress them instead of decoding to RGBA32
+cmprAsDXT1 = 0
+
+# Return textures without transparency as RGB24 instead of RGBA32
+opaqueAsRGB24 = 0
+
+# Quality tier used by writeTexture for CMPR
+cmprQuality = NINTEX_CMPR_PCA
+
+# Texture Finder: candidates to try, how many to show and how many processes to use (0 = no pool)
+finderWidths = (32, 64, 128, 256, 512, 1024)
+finderOffsets = (0,)
+finderFormats = None  # all non-paletted formats
+finderTopN = 8
+finderWorkers = 0
+finderScoreRows = 128
+# also guess widths and offsets from the data (needs NumPy) and score them with the lists above
+finderInfer = 1
+finderInferCount = 4
+# texels decoded to check each inferred guess (at least 4 tile rows, at most finderScoreRows rows)
+finderInferTexels = 0x4000
+# also show the data as raw DXT1/DXT3/DXT5 at width 256, like the original finder
+finderRawDXT = 1
+
+# Split the decode of textures of at least decodeParallelPixels texels across decodeWorkers processes (0 = never).
+# Only formats slow enough to win back the shared memory copies are split: at GX sizes that is CMPR.
+decodeWorkers = 0
+decodeParallelPixels = 0x40000
+decodeParallelFormats = (NINTEX_CMPR,)
+
+# Threads readTextures decodes with (0 = one after another)
+batchWorkers = 0
+
+# Decoded texture cache used by readTexture: in-memory LRU size and optional on-disk store (None = off)
+cacheMemoryBytes = 0
+cachePath = None
+cacheDiskBytes = 0x40000000
+
+# Per-format decode counters, see stats(). Can be turned on with the NINTEX_STATS environment variable.
+collectStats = 1 if os.environ.get('NINTEX_STATS', '0') not in ('', '0') else 0
+
 
 class pixelParser:
     @staticmethod
@@ -103,12 +194,192 @@ class pixelParser:
         t[3] = (rawPixel >> 8) & 0xFF
         return t
 
+    # Encoders take 8-bit channels and return the raw pixel value.
+    # They work on ints and on NumPy arrays of uint32 alike.
+
+    @staticmethod
+    def to_i4(r, g, b, a = 0xFF):
+        return scaleDown(intensity(r, g, b), 0x0F)
+
+    @staticmethod
+    def to_i8(r, g, b, a = 0xFF):
+        return intensity(r, g, b)
+
+    @staticmethod
+    def to_ia4(r, g, b, a = 0xFF):
+        return (scaleDown(a, 0x0F) << 4) | scaleDown(intensity(r, g, b), 0x0F)
+
+    @staticmethod
+    def to_ia8(r, g, b, a = 0xFF):
+        return (a << 8) | intensity(r, g, b)
+
+    @staticmethod
+    def to_rgb565(r, g, b, a = 0xFF):
+        r = scaleDown(r, 0x1F)
+        g = scaleDown(g, 0x3F)
+        b = scaleDown(b, 0x1F)
+        return (r << 11) | (g << 5) | b
+
+    @staticmethod
+    def to_rgb5a3(r, g, b, a = 0xFF):
+        a3 = scaleDown(a, 0x07)
+        rgb555 = 0x8000 | (scaleDown(r, 0x1F) << 10) | (scaleDown(g, 0x1F) << 5) | scaleDown(b, 0x1F)
+        rgb4a3 = (a3 << 12) | (scaleDown(r, 0x0F) << 8) | (scaleDown(g, 0x0F) << 4) | scaleDown(b, 0x0F)
+        if np is not None and isinstance(a3, np.ndarray):
+            return np.where(a3 == 0x07, rgb555, rgb4a3)
+        return rgb555 if a3 == 0x07 else rgb4a3
+
+
+def scaleDown(x, maxValue):
+    # 8-bit channel to maxValue, rounded to nearest
+    return (x * maxValue + 0x7F) // 0xFF
+
+
+def intensity(r, g, b):
+    return (r * 77 + g * 150 + b * 29 + 0x80) >> 8
+
+
+class vectorParser:
+    # Decoders that work on a band of rows at once and write RGBA32 into
+    # `out`, a (rows, width, 4) view of the final texture. Output is
+    # identical to pixelParser and textureParser. Simple and indexed
+    # formats take `raw`, the unswizzled rows of the band; RGBA32 and CMPR
+    # take `src`, the band's tiles as stored.
+
+    @staticmethod
+    def rgbaBuffer(width, height):
+        textureData = bytearray(width * height * 4)
+        return textureData, np.frombuffer(textureData, dtype=np.uint8).reshape(height, width, 4)
+
+    @staticmethod
+    def gray(v, a, out):
+        out[:, :, 0] = v
+        out[:, :, 1] = v
+        out[:, :, 2] = v
+        out[:, :, 3] = a
+
+    @staticmethod
+    def nibbles(raw, width):
+        # 4-bit rows are padded to whole bytes
+        v = np.empty((raw.shape[0], raw.shape[1] * 2), dtype=np.uint8)
+        v[:, 0::2] = raw >> 4
+        v[:, 1::2] = raw & 0xF
+        return v[:, :width]
+
+    @staticmethod
+    def words(raw):
+        return (raw[:, 0::2].astype(np.uint16) << 8) | raw[:, 1::2]
+
     @staticmethod
-    def to_rgb565(r, g, b, a = 0):
-        r = r * 0x1f // 0xff & 0x1f
-        g = g * 0x3f // 0xff & 0x3f
-        b = b * 0x1f // 0xff & 0x1f
-        return r << 11 + g << 5 + b
+    def i4(raw, out):
+        vectorParser.gray(vectorParser.nibbles(raw, out.shape[1]) * 0x11, 0xFF, out)
+
+    @staticmethod
+    def i8(raw, out):
+        vectorParser.gray(raw, 0xFF, out)
+
+    @staticmethod
+    def ia4(raw, out):
+        vectorParser.gray((raw & 0xF) * 0x11, (raw >> 4) * 0x11, out)
+
+    @staticmethod
+    def lookup16(raw, out, dataFormat):
+        np.take(getLookupTable(dataFormat), vectorParser.words(raw), axis=0, out=out, mode='clip')
+
+    @staticmethod
+    def ia8(raw, out):
+        vectorParser.lookup16(raw, out, NINTEX_IA8)
+
+    @staticmethod
+    def rgb565(raw, out):
+        vectorParser.lookup16(raw, out, NINTEX_RGB565)
+
+    @staticmethod
+    def rgb5a3(raw, out):
+        vectorParser.lookup16(raw, out, NINTEX_RGB5A3)
+
+    @staticmethod
+    def indexed(raw, out, palette, bpp):
+        if bpp == 16:
+            indices = vectorParser.words(raw) & (len(palette) - 1)
+        elif bpp == 8:
+            indices = raw
+        else:
+            indices = vectorParser.nibbles(raw, out.shape[1])
+        np.take(palette, indices, axis=0, out=out, mode='clip')
+
+    @staticmethod
+    def tiles(out, tile):
+        # (tileRows, tilesX, bh, bw, 4) texels to rows of the image
+        rows, width = out.shape[:2]
+        tileRows, tilesX, bh, bw = tile.shape[:4]
+        out[:] = tile.transpose(0, 2, 1, 3, 4).reshape(tileRows * bh, tilesX * bw, 4)[:rows, :width]
+
+    @staticmethod
+    def rgba32(src, tilesX, out):
+        # each 4x4 tile holds 16 AR pairs followed by 16 GB pairs
+        planes = src.reshape(-1, tilesX, 2, 4, 4, 2)
+        tile = np.empty(planes.shape[:2] + (4, 4, 4), dtype=np.uint8)
+        tile[..., 0] = planes[:, :, 0, :, :, 1]
+        tile[..., 1] = planes[:, :, 1, :, :, 0]
+        tile[..., 2] = planes[:, :, 1, :, :, 1]
+        tile[..., 3] = planes[:, :, 0, :, :, 0]
+        vectorParser.tiles(out, tile)
+
+    @staticmethod
+    def cmpr(src, tilesX, out):
+        # 8x8 tiles of four DXT1-like blocks; same arithmetic as textureParser.cmpr
+        blocks = src.reshape(-1, 8)
+        c0 = (blocks[:, 0].astype(np.uint16) << 8) | blocks[:, 1]
+        c1 = (blocks[:, 2].astype(np.uint16) << 8) | blocks[:, 3]
+        table = getLookupTable(NINTEX_RGB565)
+        p0 = table[c0].astype(np.uint16)
+        p1 = table[c1].astype(np.uint16)
+        four = (c0 > c1)[:, None]
+
+        palette = np.empty((blocks.shape[0], 4, 4), dtype=np.uint8)
+        palette[:, 0] = p0
+        palette[:, 1] = p1
+        palette[:, 2] = np.where(four, (2 * p0 + p1) // 3, (p0 + p1) // 2)
+        palette[:, 3] = np.where(four, (2 * p1 + p0) // 3, 0)
+
+        indices = (blocks[:, 4:8, None] >> np.array([6, 4, 2, 0], dtype=np.uint8)) & 3
+        texels = palette[np.arange(blocks.shape[0])[:, None], indices.reshape(-1, 16)]
+        tile = texels.reshape(-1, tilesX, 2, 2, 4, 4, 4).transpose(0, 1, 2, 4, 3, 5, 6).reshape(-1, tilesX, 8, 8, 4)
+        vectorParser.tiles(out, tile)
+
+
+class lookupTableBuilder:
+    # Expand every possible 16-bit value of a format at once.
+    # Return a (0x10000, 4) array of RGBA values identical to pixelParser.
+
+    @staticmethod
+    def ia8(v):
+        rgba = np.empty((v.size, 4), dtype=np.uint8)
+        rgba[:, 0] = v & 0xFF
+        rgba[:, 1] = v & 0xFF
+        rgba[:, 2] = v & 0xFF
+        rgba[:, 3] = v >> 8
+        return rgba
+
+    @staticmethod
+    def rgb565(v):
+        rgba = np.empty((v.size, 4), dtype=np.uint8)
+        rgba[:, 0] = ((v >> 11) & 0x1F) * 0xFF // 0x1F
+        rgba[:, 1] = ((v >> 5)  & 0x3F) * 0xFF // 0x3F
+        rgba[:, 2] = ((v >> 0)  & 0x1F) * 0xFF // 0x1F
+        rgba[:, 3] = 0xFF
+        return rgba
+
+    @staticmethod
+    def rgb5a3(v):
+        opaque = (v & 0x8000) != 0
+        rgba = np.empty((v.size, 4), dtype=np.uint8)
+        rgba[:, 0] = np.where(opaque, ((v >> 10) & 0x1F) * 0xFF // 0x1F, ((v >> 8)  & 0x0F) * 0x11)
+        rgba[:, 1] = np.where(opaque, ((v >> 5)  & 0x1F) * 0xFF // 0x1F, ((v >> 4)  & 0x0F) * 0x11)
+        rgba[:, 2] = np.where(opaque, ((v >> 0)  & 0x1F) * 0xFF // 0x1F, ((v >> 0)  & 0x0F) * 0x11)
+        rgba[:, 3] = np.where(opaque, 0xFF, ((v >> 12) & 0x07) * 0xFF // 0x07)
+        return rgba
 
 
 class textureParser:
@@ -118,7 +389,7 @@ class textureParser:
         name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[df]
         bs = NoeBitStream(buffer, NOE_BIGENDIAN)
         _width, _height = getStorageWH(width, height, df)
-        textureData = bytearray(_width * _height * 4)
+        textureData = bytearray(width * height * 4)
 
         for y in range(0, _height, bh):
             for x in range(0, _width, bw):
@@ -145,11 +416,12 @@ class textureParser:
 
                         for y3 in range(4):
                             b = bs.readUByte()
-                            for x3 in range(4):
-                                idx = (((y + y2 + y3) * _width) + (x + x2 + x3)) * 4
+                            if y + y2 + y3 >= height:
+                                continue
+                            for x3 in range(min(4, width - x - x2)):
+                                idx = (((y + y2 + y3) * width) + (x + x2 + x3)) * 4
                                 textureData[idx : idx + 4] = c[(b >> (6 - (x3 * 2))) & 0x3]
 
-        textureData = crop(textureData, _width, _height, 32, width, height)
         return NoeTexture("default", width, height, textureData, noesis.NOESISTEX_RGBA32)
 
     @staticmethod
@@ -157,60 +429,57 @@ class textureParser:
         df = NINTEX_RGBA32
         name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[df]
         _width, _height = getStorageWH(width, height, df)
-        textureData = bytearray(_width * _height * 4)
+        textureData = bytearray(width * height * 4)
         offset = 0
 
         for y in range(0, _height, bh):
             for x in range(0, _width, bw):
                 for y2 in range(bh):
                     for x2 in range(bw):
-                        idx = (((y + y2) * _width) + (x + x2)) * 4
-                        textureData[idx + 0] = buffer[offset + 33]
-                        textureData[idx + 1] = buffer[offset + 32]
-                        textureData[idx + 2] = buffer[offset + 1]
-                        textureData[idx + 3] = buffer[offset + 0]
+                        if y + y2 < height and x + x2 < width:
+                            idx = (((y + y2) * width) + (x + x2)) * 4
+                            textureData[idx + 0] = buffer[offset + 1]
+                            textureData[idx + 1] = buffer[offset + 32]
+                            textureData[idx + 2] = buffer[offset + 33]
+                            textureData[idx + 3] = buffer[offset + 0]
                         offset += 2
                 offset += 32
 
-        textureData = crop(textureData, _width, _height, 32, width, height)
         return NoeTexture("default", width, height, textureData, noesis.NOESISTEX_RGBA32)
 
     @staticmethod
     def indexed(dataFormat, buffer, width, height, paletteBuffer, pixelFormat):
         name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
-        textureData = bytearray(width * height * 4)
-
-        bs = NoeBitStream(paletteBuffer, NOE_BIGENDIAN)
-        palette = [pixelFormats[pixelFormat](bs.readUShort()) for i in range(paletteLen)]
+        if paletteBuffer is None:
+            raise ValueError("Palette is required for format " + name)
 
+        # c14x2 uses the low 14 bits of each index
+        indexMask = 0x3FFF if bpp == 16 else (1 << bpp) - 1
+        palette = getExpandedPalette(paletteBuffer, pixelFormat, indexMask + 1)
         tex = unswizzle(buffer, width, height, dataFormat)
-        bs = NoeBitStream(tex, NOE_BIGENDIAN)
+        count = width * height
 
         if bpp == 16:
-            for i in range(width * height):
-                textureData[i * 4:(i + 1) * 4] = palette[bs.readUShort()]
+            indices = (v & indexMask for v in struct.unpack('>%dH' % count, tex[:count * 2]))
         elif bpp == 8:
-            for i in range(width * height):
-                textureData[i * 4:(i + 1) * 4] = palette[bs.readUByte()]
-        elif bpp == 4:
-            for i in range(0, width * height, 2):
-                b = bs.readUByte()
-                textureData[i * 4:(i + 1) * 4] = palette[(b >> 4) & 0xf]
-                textureData[(i + 1) * 4:(i + 2) * 4] = palette[b & 0xf]
+            indices = tex[:count]
+        else:
+            indices = nibbles(tex, width, height)
+        textureData = bytearray(b''.join(map(palette.__getitem__, indices)))
 
         return NoeTexture("default", width, height, textureData, noesis.NOESISTEX_RGBA32)
 
     @staticmethod
     def c4(buffer, width, height, paletteBuffer, pixelFormat):
-        return indexed(0x08, buffer, width, height, paletteBuffer, pixelFormat)
+        return textureParser.indexed(NINTEX_C4, buffer, width, height, paletteBuffer, pixelFormat)
 
     @staticmethod
     def c8(buffer, width, height, paletteBuffer, pixelFormat):
-        return indexed(0x09, buffer, width, height, paletteBuffer, pixelFormat)
+        return textureParser.indexed(NINTEX_C8, buffer, width, height, paletteBuffer, pixelFormat)
 
     @staticmethod
     def c14x2(buffer, width, height, paletteBuffer, pixelFormat):
-        return indexed(0x0A, buffer, width, height, paletteBuffer, pixelFormat)
+        return textureParser.indexed(NINTEX_C14X2, buffer, width, height, paletteBuffer, pixelFormat)
 
 
 dataFormats = {
@@ -228,16 +497,147 @@ dataFormats = {
     0x0E: ("cmpr",   textureParser.cmpr,    4, 8, 8, False, 0)
 }
 
+vectorDecoders = {
+    NINTEX_I4:     vectorParser.i4,
+    NINTEX_I8:     vectorParser.i8,
+    NINTEX_IA4:    vectorParser.ia4,
+    NINTEX_IA8:    vectorParser.ia8,
+    NINTEX_RGB565: vectorParser.rgb565,
+    NINTEX_RGB5A3: vectorParser.rgb5a3,
+}
+
+# palette pixel format: data format of its entries
 pixelFormats = {
-    0x00 : pixelParser.ia8,
-    0x01 : pixelParser.rgb565,
-    0x02 : pixelParser.rgb5a3
+    0x00 : NINTEX_IA8,
+    0x01 : NINTEX_RGB565,
+    0x02 : NINTEX_RGB5A3
 }
 
+# 16-bit data format -> RGBA table, built lazily by getLookupTable
+lookupTables = {}
+lookupTableStats = {}
+
+
+def buildLookupTable(dataFormat):
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
+    start = time.perf_counter()
+
+    if np is not None:
+        table = getattr(lookupTableBuilder, name)(np.arange(0x10000, dtype=np.uint32))
+        size = table.nbytes
+    else:
+        table = tuple(bytes(decoder(v)) for v in range(0x10000))
+        size = sys.getsizeof(table) + sum(sys.getsizeof(x) for x in table)
+
+    lookupTableStats[dataFormat] = {
+        'name':      name,
+        'buildTime': time.perf_counter() - start,
+        'bytes':     size,
+        'builtAt':   'first use' if moduleImported else 'import',
+    }
+    return table
+
+
+def getLookupTable(dataFormat):
+    table = lookupTables.get(dataFormat)
+    if table is None:
+        table = lookupTables[dataFormat] = buildLookupTable(dataFormat)
+    return table
+
+
+def expandPalette(paletteBuffer, pixelFormat, entries):
+    # RGBA palette with exactly `entries` entries; missing ones are transparent black
+    table = getLookupTable(pixelFormats[pixelFormat])
+    count = min(len(paletteBuffer) // 2, entries)
+
+    if np is not None:
+        palette = np.zeros((entries, 4), dtype=np.uint8)
+        palette[:count] = table[np.frombuffer(paletteBuffer, dtype='>u2', count=count)]
+        return palette
 
-def crop(buffer, width, height, bpp, newWidth, newHeight):
+    palette = [bytes(table[v]) for v in struct.unpack('>%dH' % count, paletteBuffer[:count * 2])]
+    return palette + [bytes(4)] * (entries - count)
+
+
+# format name -> decode counters, while collectStats is set
+formatStats = {}
+
+
+def getFormatStats(dataFormat):
+    name = dataFormats[dataFormat][0]
+    res = formatStats.get(name)
+    if res is None:
+        res = formatStats[name] = {'textures': 0, 'pixels': 0, 'sourceBytes': 0,
+                                   'unswizzleTime': 0.0, 'decodeTime': 0.0, 'cropTime': 0.0}
+    return res
+
+
+def addStatsTime(dataFormat, key, start):
+    getFormatStats(dataFormat)[key] += time.perf_counter() - start
+
+
+def countTexture(dataFormat, width, height, buffer):
+    res = getFormatStats(dataFormat)
+    res['textures'] += 1
+    res['pixels'] += width * height
+    res['sourceBytes'] += min(len(buffer), getTextureSizeInBytes(width, height, dataFormat))
+
+
+def startStats(dataFormat):
+    res = getFormatStats(dataFormat)
+    return time.perf_counter(), res['unswizzleTime'] + res['cropTime']
+
+
+def stopStats(dataFormat, start):
+    # decode time is the wall time since startStats, minus what went to unswizzle and crop meanwhile
+    res = getFormatStats(dataFormat)
+    startTime, startOther = start
+    res['decodeTime'] += time.perf_counter() - startTime - (res['unswizzleTime'] + res['cropTime'] - startOther)
+
+
+def stats():
+    # Decode counters per format name
+    return dict((name, dict(counters)) for name, counters in formatStats.items())
+
+
+def resetStats():
+    formatStats.clear()
+
+
+# expanded palettes by (pixel format, entries, palette data), shared by the textures that use them
+expandedPalettes = collections.OrderedDict()
+expandedPalettesLock = threading.Lock()
+expandedPalettesSize = 64
+
+
+def getExpandedPalette(paletteBuffer, pixelFormat, entries):
+    # expandPalette, reusing the result for palettes seen before. The result must not be modified.
+    key = (pixelFormat, entries, bytes(paletteBuffer))
+    with expandedPalettesLock:
+        palette = expandedPalettes.get(key)
+        if palette is not None:
+            expandedPalettes.move_to_end(key)
+            return palette
+
+    palette = expandPalette(paletteBuffer, pixelFormat, entries)
+    if np is not None:
+        palette.setflags(write=False)
+    with expandedPalettesLock:
+        expandedPalettes[key] = palette
+        while len(expandedPalettes) > expandedPalettesSize:
+            expandedPalettes.popitem(last=False)
+    return palette
+
+
+def getLookupTableStats():
+    # build cost and memory of every table built so far, keyed by format name
+    return {x['name']: dict(x) for x in lookupTableStats.values()}
+
+
+def crop(buffer, width, height, bpp, newWidth, newHeight, dataFormat=None):
     if width == newWidth and height == newHeight:
         return buffer
+    start = time.perf_counter() if collectStats and dataFormat is not None else None
 
     res = bytearray(newWidth * newHeight * bpp // 8)
 
@@ -248,6 +648,70 @@ def crop(buffer, width, height, bpp, newWidth, newHeight):
         src = y * width * bpp // 8
         res[dst: dst + lw] = buffer[src: src + lw]
 
+    if start is not None:
+        addStatsTime(dataFormat, 'cropTime', start)
+    return res
+
+
+# reverses the order of the 2-bit texel indices in a byte
+cmprIndexTable = bytes(((b & 3) << 6) | (((b >> 2) & 3) << 4) | (((b >> 4) & 3) << 2) | ((b >> 6) & 3) for b in range(256))
+
+
+def dxt1ToCMPR(buffer, width, height):
+    # Inverse of cmprToDXT1. Blocks beyond the visible size are left empty.
+    _width, _height = getStorageWH(width, height, NINTEX_CMPR)
+    blocksX = (width + 3) // 4
+    blocksY = (height + 3) // 4
+
+    if np is not None:
+        blocks = np.zeros((_height // 4, _width // 4, 8), dtype=np.uint8)
+        blocks[:blocksY, :blocksX] = np.frombuffer(buffer, dtype=np.uint8, count=blocksX * blocksY * 8).reshape(blocksY, blocksX, 8)
+        src = bytearray(blocks.reshape(_height // 8, 2, _width // 8, 2, 8).transpose(0, 2, 1, 3, 4).tobytes())
+    else:
+        src = bytearray(_width * _height // 2)
+        for y in range(blocksY):
+            for x in range(blocksX):
+                dst = ((y // 2 * (_width // 8) + x // 2) * 4 + y % 2 * 2 + x % 2) * 8
+                src[dst: dst + 8] = buffer[(y * blocksX + x) * 8: (y * blocksX + x + 1) * 8]
+
+    colors = src[0::8], src[1::8], src[2::8], src[3::8]
+    src = bytearray(src.translate(cmprIndexTable))
+    src[0::8], src[1::8], src[2::8], src[3::8] = colors[1], colors[0], colors[3], colors[2]
+    return src
+
+
+def cmprToDXT1(buffer, width, height):
+    # CMPR is DXT1 stored in 8x8 tiles of four 4x4 blocks, with big-endian
+    # colors and the texel indices of each row in reverse order.
+    _width, _height = getStorageWH(width, height, NINTEX_CMPR)
+    tilesX = _width // 8
+    blocksX = (width + 3) // 4
+    blocksY = (height + 3) // 4
+
+    src = bytearray(buffer[:_width * _height // 2])
+    colors = src[0::8], src[1::8], src[2::8], src[3::8]
+    src = bytearray(src.translate(cmprIndexTable))
+    src[0::8], src[1::8], src[2::8], src[3::8] = colors[1], colors[0], colors[3], colors[2]
+
+    if np is not None:
+        blocks = np.frombuffer(src, dtype=np.uint8).reshape(_height // 8, tilesX, 2, 2, 8)
+        blocks = blocks.transpose(0, 2, 1, 3, 4).reshape(_height // 4, _width // 4, 8)
+        return bytearray(blocks[:blocksY, :blocksX].tobytes())
+
+    res = bytearray()
+    for y in range(blocksY):
+        row = (y // 2 * tilesX * 4 + y % 2 * 2) * 8
+        res += b''.join(src[row + x * 32: row + x * 32 + 16] for x in range(tilesX))[:blocksX * 8]
+    return res
+
+
+def nibbles(tex, width, height):
+    # 4-bit values of an unswizzled image; rows are padded to whole bytes
+    rowSize = (width + 1) // 2
+    res = []
+    for y in range(height):
+        row = [v for b in tex[y * rowSize: (y + 1) * rowSize] for v in (b >> 4, b & 0xF)]
+        res += row[:width]
     return res
 
 
@@ -258,48 +722,271 @@ def getStorageWH(width, height, df):
     return width, height
 
 
+@functools.lru_cache(maxsize=64)
+def getTilePermutation(tilesX, tilesY, bh):
+    # Index of the tiled strip (one row of a block) that lands at each strip
+    # of the row-major image. Shared by unswizzle and swizzle.
+    if np is not None:
+        perm = np.arange(tilesY * tilesX * bh).reshape(tilesY, tilesX, bh).transpose(0, 2, 1).reshape(tilesY * bh, tilesX)
+        perm.setflags(write=False)
+        return perm
+    return tuple(tuple((y // bh * tilesX + x) * bh + y % bh for x in range(tilesX)) for y in range(tilesY * bh))
+
+
 def unswizzle(buffer, width, height, df):
     name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[df]
     stripSize = bpp * bw // 8
+    rowSize = (width * bpp + 7) // 8
 
     _width, _height = getStorageWH(width, height, df)
+    size = _width * _height * bpp // 8
+    if len(buffer) < size:
+        buffer = bytes(buffer) + bytes(size - len(buffer))
+
+    if np is not None:
+        return bytearray(unswizzleRows(np.frombuffer(buffer, dtype=np.uint8, count=size), width, 0, height, df).tobytes())
+
+    start = time.perf_counter() if collectStats else None
+    perm = getTilePermutation(_width // bw, _height // bh, bh)
+    res = bytearray(b''.join(
+        b''.join(buffer[p * stripSize: (p + 1) * stripSize] for p in perm[y])[:rowSize]
+        for y in range(height)))
+    if start is not None:
+        addStatsTime(df, 'unswizzleTime', start)
+    return res
 
-    result = bytearray(_width * _height * bpp // 8)
-    ptr = 0
 
-    for y in range(0, _height, bh):
-        for x in range(0, _width, bw):
-            for y2 in range(bh):
-                idx = (((y + y2) * _width) + x) * bpp // 8
-                result[idx : idx+stripSize] = buffer[ptr : ptr+stripSize]
-                ptr += stripSize
+def unswizzleRows(src, width, y0, y1, df, scratch=None):
+    # Rows y0..y1 of an image as a (rows, rowSize) array, where src holds
+    # the tile rows from y0 on. y0 must be at a tile row boundary.
+    # The rows are gathered into scratch (a scratchBuffer) if given.
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[df]
+    stripSize = bpp * bw // 8
+    rowSize = (width * bpp + 7) // 8
+    tilesX = (width + bw - 1) // bw
+    tileRows = (y1 - y0 + bh - 1) // bh
+
+    start = time.perf_counter() if collectStats else None
+    perm = getTilePermutation(tilesX, tileRows, bh)
+    strips = src[:tilesX * tileRows * bh * stripSize].reshape(-1, stripSize)
+    if scratch is None:
+        res = strips[perm[:y1 - y0]]
+    else:
+        res = np.take(strips, perm[:y1 - y0], axis=0, out=scratch.get((y1 - y0, tilesX, stripSize)))
+    res = res.reshape(y1 - y0, -1)[:, :rowSize]
+    if start is not None:
+        addStatsTime(df, 'unswizzleTime', start)
+    return res
+
+
+def decodeRows(src, width, y0, y1, df, palette, out, scratch=None):
+    # Decode rows y0..y1 into out; src holds the tile rows from y0 on.
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[df]
+    tilesX = (width + bw - 1) // bw
+    size = tilesX * ((y1 - y0 + bh - 1) // bh) * bw * bh * bpp // 8
+
+    if df == NINTEX_RGBA32:
+        vectorParser.rgba32(src[:size], tilesX, out)
+    elif df == NINTEX_CMPR:
+        vectorParser.cmpr(src[:size], tilesX, out)
+    elif paletteLen:
+        vectorParser.indexed(unswizzleRows(src, width, y0, y1, df, scratch), out, palette, bpp)
+    else:
+        vectorDecoders[df](unswizzleRows(src, width, y0, y1, df, scratch), out)
+
+
+class scratchBuffer:
+    # Reusable memory for the unswizzled rows of a band
+    def __init__(self, size=0):
+        self.data = np.empty(size, dtype=np.uint8)
 
-    return crop(result, _width, _height, bpp, width, height)
+    def get(self, shape):
+        size = 1
+        for x in shape:
+            size *= x
+        if self.data.size < size:
+            self.data = np.empty(size, dtype=np.uint8)
+        return self.data[:size].reshape(shape)
+
+
+# scratchBuffer the current thread's decodes use, set by readTextures
+scratchLocal = threading.local()
+
+
+def getScratchSize(width, dataFormat):
+    # bytes of the unswizzled rows of a band
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
+    return getBandHeight(width, dataFormat) * getStorageWH(width, bh, dataFormat)[0] * bpp // 8
+
+
+def getBandHeight(width, df, pixels=0x10000):
+    # rows per band: whole tile rows, about `pixels` texels each
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[df]
+    return max(pixels // (((width + bw - 1) // bw) * bw * bh), 1) * bh
+
+
+def getDecodeSource(buffer, width, height, dataFormat, palette=None, pixelFormat=None):
+    # Source as a uint8 array (zero-padded if truncated) and the expanded palette of indexed formats
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
+    size = getTextureSizeInBytes(width, height, dataFormat)
+    if len(buffer) < size:
+        buffer = bytes(buffer) + bytes(size - len(buffer))
+    src = np.frombuffer(buffer, dtype=np.uint8, count=size)
+
+    if paletteLen:
+        if palette is None:
+            raise ValueError("Palette is required for format " + name)
+        indexMask = 0x3FFF if bpp == 16 else (1 << bpp) - 1
+        palette = getExpandedPalette(palette, pixelFormat, indexMask + 1)
+    return src, palette
+
+
+def decodeBands(src, width, y0, y1, dataFormat, palette, rgba):
+    # Decode rows y0..y1 (y0 on a tile row) into rgba, the whole image, one band at a time
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
+    band = getBandHeight(width, dataFormat)
+    rowSize = getTextureSizeInBytes(width, bh, dataFormat)
+    scratch = getattr(scratchLocal, 'buffer', None)
+    for y in range(y0, y1, band):
+        decodeRows(src[y // bh * rowSize:], width, y, min(y + band, y1), dataFormat, palette, rgba[y: min(y + band, y1)], scratch)
+
+
+def decodeImage(buffer, width, height, dataFormat, palette=None, pixelFormat=None):
+    # Decode straight from the source into a single width x height RGBA32
+    # buffer, one band of tile rows at a time.
+    src, palette = getDecodeSource(buffer, width, height, dataFormat, palette, pixelFormat)
+
+    if (decodeWorkers > 0 and width * height >= decodeParallelPixels and dataFormat in decodeParallelFormats
+            and shared_memory is not None):
+        textureData = decodeParallel(src, width, height, dataFormat, palette)
+        if textureData is not None:
+            return textureData
+
+    textureData, rgba = vectorParser.rgbaBuffer(width, height)
+    decodeBands(src, width, 0, height, dataFormat, palette, rgba)
+    return textureData
+
+
+decodePool = None
+processPoolFailed = False
+
+
+def canUseProcessPool():
+    return ProcessPoolExecutor is not None and not processPoolFailed
+
+
+def disableProcessPool():
+    # Workers import this library, so wherever they can't (no Noesis modules outside
+    # Noesis, no way to spawn) every pool fails the same way: stop paying for it.
+    global processPoolFailed, decodePool
+    processPoolFailed = True
+    if decodePool is not None:
+        decodePool.shutdown(wait=False)
+        decodePool = None
+
+
+def getDecodePool():
+    # Kept between textures: starting the workers costs more than decoding most textures
+    global decodePool
+    if decodePool is None or decodePool._max_workers != decodeWorkers:
+        if decodePool is not None:
+            decodePool.shutdown()
+        decodePool = ProcessPoolExecutor(decodeWorkers)
+    return decodePool
+
+
+def attachSharedMemory(name):
+    try:
+        # don't let the worker's resource tracker unlink the parent's block
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name)
+
+
+def decodeSharedRows(task):
+    # Worker: decode rows y0..y1 of the source block into the output block
+    srcName, outName, size, width, height, dataFormat, palette, y0, y1 = task
+    srcBlock = attachSharedMemory(srcName)
+    outBlock = attachSharedMemory(outName)
+    try:
+        src = np.frombuffer(srcBlock.buf, dtype=np.uint8, count=size)
+        rgba = np.frombuffer(outBlock.buf, dtype=np.uint8, count=width * height * 4).reshape(height, width, 4)
+        decodeBands(src, width, y0, y1, dataFormat, palette, rgba)
+        del src, rgba
+    finally:
+        srcBlock.close()
+        outBlock.close()
+    return y1 - y0
+
+
+def decodeParallel(src, width, height, dataFormat, palette):
+    # Decode with the block rows split across the decode pool. Source and output
+    # live in shared memory, so only the task tuples are pickled.
+    # Returns None if the pool can't be used.
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
+    if not canUseProcessPool():
+        return None
+
+    tileRows = (height + bh - 1) // bh
+    rows = max((tileRows + decodeWorkers * 4 - 1) // (decodeWorkers * 4), 1) * bh
+    blocks = []
+    try:
+        srcBlock = shared_memory.SharedMemory(create=True, size=max(len(src), 1))
+        blocks.append(srcBlock)
+        outBlock = shared_memory.SharedMemory(create=True, size=width * height * 4)
+        blocks.append(outBlock)
+        srcBlock.buf[:len(src)] = src.tobytes()
+
+        tasks = [(srcBlock.name, outBlock.name, len(src), width, height, dataFormat, palette, y, min(y + rows, height))
+                 for y in range(0, height, rows)]
+        if sum(getDecodePool().map(decodeSharedRows, tasks)) != height:
+            return None
+        return bytearray(outBlock.buf[:width * height * 4])
+    except (OSError, RuntimeError, BrokenProcessPool):
+        # embedded interpreters can't always spawn workers
+        disableProcessPool()
+        return None
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
 
 
 def swizzle(buffer, width, height, df):
     name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[df]
     stripSize = bpp * bw // 8
+    rowSize = (width * bpp + 7) // 8
 
     _width, _height = getStorageWH(width, height, df)
+    _rowSize = _width * bpp // 8
 
-    result = bytearray(_width * _height * bpp // 8)
-    ptr = 0
+    perm = getTilePermutation(_width // bw, _height // bh, bh)
 
-    for y in range(0, _height, bh):
-        for x in range(0, _width, bw):
-            for y2 in range(bh):
-                idx = (((y + y2) * width) + x ) * bpp // 8
-                result[ptr : ptr+stripSize] = buffer[idx : idx+stripSize]
-                ptr += stripSize
+    if np is not None:
+        image = np.zeros((_height, _rowSize), dtype=np.uint8)
+        image[:height, :rowSize] = np.frombuffer(buffer, dtype=np.uint8, count=height * rowSize).reshape(height, rowSize)
+        result = np.empty((_width * _height // bw, stripSize), dtype=np.uint8)
+        result[perm] = image.reshape(_height, -1, stripSize)
+        return bytearray(result.tobytes())
+
+    result = bytearray(_width * _height * bpp // 8)
+    for y in range(height):
+        row = bytes(buffer[y * rowSize: (y + 1) * rowSize]).ljust(_rowSize, b'\0')
+        for x, p in enumerate(perm[y]):
+            result[p * stripSize: (p + 1) * stripSize] = row[x * stripSize: (x + 1) * stripSize]
 
     return result
 
 
-def convert(buffer, width, height, dataFormat, palette=None, pixelFormat=None):
+def decodeRGBA(buffer, width, height, dataFormat, palette=None, pixelFormat=None):
+    # RGBA32 pixel data of a texture. convert applies cmprAsDXT1 and opaqueAsRGB24
+    # on top of it, so code that reads the texels itself decodes with this instead.
     name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
 
-    if bSimple:
+    if np is not None:
+        return decodeImage(buffer, width, height, dataFormat, palette, pixelFormat)
+
+    elif bSimple:
         tex = unswizzle(buffer, width, height, dataFormat)
         bs = NoeBitStream(tex, NOE_BIGENDIAN)
         textureData = bytearray(width * height * 4)
@@ -308,40 +995,811 @@ def convert(buffer, width, height, dataFormat, palette=None, pixelFormat=None):
             for i in range(width * height):
                 textureData[i*4:(i+1)*4] = decoder(bs.readUInt())
         elif bpp == 16:
-            for i in range(width * height):
-                textureData[i*4:(i+1)*4] = decoder(bs.readUShort())
+            table = getLookupTable(dataFormat)
+            textureData = bytearray(b''.join(map(table.__getitem__, struct.unpack('>%dH' % (width * height), tex[:width * height * 2]))))
         elif bpp == 8:
             for i in range(width * height):
                 textureData[i*4:(i+1)*4] = decoder(bs.readUByte())
         elif bpp == 4:
-            for i in range(0, width * height, 2):
-                b = bs.readUByte()
-                textureData[i*4:(i+1)*4] = decoder((b >> 4) & 0xf )
-                textureData[(i+1)*4:(i+2)*4] = decoder(b & 0xf)
+            for i, v in enumerate(nibbles(tex, width, height)):
+                textureData[i*4:(i+1)*4] = decoder(v)
 
-        return NoeTexture("default", width, height, textureData, noesis.NOESISTEX_RGBA32)
+        return textureData
 
     else:
-        return decoder(buffer, width, height, palette, pixelFormat)
+        return decoder(buffer, width, height, palette, pixelFormat).pixelData
+
+
+# formats that can't hold transparency
+opaqueFormats = (NINTEX_I4, NINTEX_I8, NINTEX_RGB565)
+
+
+def isOpaque(textureData, dataFormat):
+    if dataFormat in opaqueFormats or not textureData:
+        return True
+    if np is not None:
+        return bool(np.frombuffer(textureData, dtype=np.uint8)[3::4].min() == 0xFF)
+    return min(textureData[3::4]) == 0xFF
+
+
+def rgbaToRGB(textureData):
+    res = bytearray(len(textureData) // 4 * 3)
+    for i in range(3):
+        res[i::3] = textureData[i::4]
+    return res
+
+
+def convert(buffer, width, height, dataFormat, palette=None, pixelFormat=None):
+    start = None
+    if collectStats:
+        countTexture(dataFormat, width, height, buffer)
+        start = startStats(dataFormat)
+
+    if dataFormat == NINTEX_CMPR and cmprAsDXT1:
+        tex = NoeTexture("default", width, height, cmprToDXT1(buffer, width, height), noesis.NOESISTEX_DXT1)
+    else:
+        textureData = decodeRGBA(buffer, width, height, dataFormat, palette, pixelFormat)
+        if opaqueAsRGB24 and isOpaque(textureData, dataFormat):
+            tex = NoeTexture("default", width, height, rgbaToRGB(textureData), noesis.NOESISTEX_RGB24)
+        else:
+            tex = NoeTexture("default", width, height, textureData, noesis.NOESISTEX_RGBA32)
+
+    if start is not None:
+        stopStats(dataFormat, start)
+    return tex
+
+
+def convertBands(buffer, width, height, dataFormat, palette=None, pixelFormat=None, bandHeight=None):
+    # Yield (y, rows): RGBA32 data of consecutive bands of whole tile rows,
+    # decoded only as they are consumed. Every band is a new buffer.
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
+    band = getBandHeight(width, dataFormat) if bandHeight is None else (max(bandHeight, 1) + bh - 1) // bh * bh
+    rowSize = getTextureSizeInBytes(width, bh, dataFormat)
+
+    if collectStats:
+        countTexture(dataFormat, width, height, buffer)
+
+    if np is not None:
+        src, palette = getDecodeSource(buffer, width, height, dataFormat, palette, pixelFormat)
+        for y in range(0, height, band):
+            y1 = min(y + band, height)
+            start = startStats(dataFormat) if collectStats else None
+            rows, rgba = vectorParser.rgbaBuffer(width, y1 - y)
+            decodeRows(src[y // bh * rowSize:], width, y, y1, dataFormat, palette, rgba)
+            if start is not None:
+                stopStats(dataFormat, start)
+            yield y, rows
+        return
+
+    # a band of whole tile rows is a texture of its own
+    for y in range(0, height, band):
+        y1 = min(y + band, height)
+        start = startStats(dataFormat) if collectStats else None
+        rows = decodeRGBA(buffer[y // bh * rowSize: (y1 + bh - 1) // bh * rowSize], width, y1 - y, dataFormat, palette, pixelFormat)
+        if start is not None:
+            stopStats(dataFormat, start)
+        yield y, rows
+
+
+def readTextureBands(bs, width, height, dataFormat, palette=None, pixelFormat=None, bandHeight=None):
+    size = getTextureSizeInBytes(width, height, dataFormat)
+    return convertBands(getSourceView(bs, size), width, height, dataFormat, palette, pixelFormat, bandHeight)
+
+
+# data format: encoder
+pixelEncoders = {
+    NINTEX_I4:     pixelParser.to_i4,
+    NINTEX_I8:     pixelParser.to_i8,
+    NINTEX_IA4:    pixelParser.to_ia4,
+    NINTEX_IA8:    pixelParser.to_ia8,
+    NINTEX_RGB565: pixelParser.to_rgb565,
+    NINTEX_RGB5A3: pixelParser.to_rgb5a3,
+}
+
+
+def encodePixels(buffer, width, height, encoder):
+    # raw pixel values of an RGBA32 image
+    count = width * height
+    if np is not None:
+        rgba = np.frombuffer(buffer, dtype=np.uint8, count=count * 4).reshape(count, 4).astype(np.uint32)
+        return encoder(rgba[:, 0], rgba[:, 1], rgba[:, 2], rgba[:, 3])
+    return [encoder(*buffer[i * 4: i * 4 + 4]) for i in range(count)]
+
+
+def packPixels(values, width, height, bpp):
+    # Big-endian raw image with rows of (width * bpp + 7) // 8 bytes
+    if np is not None:
+        values = np.asarray(values)
+        if bpp == 4:
+            values = values.reshape(height, width)
+            if width & 1:
+                values = np.concatenate((values, values[:, -1:]), axis=1)
+            return bytearray(((values[:, 0::2] << 4) | values[:, 1::2]).astype(np.uint8).tobytes())
+        return bytearray(values.astype('>u%d' % (bpp // 8)).tobytes())
+
+    if bpp == 4:
+        res = bytearray()
+        for y in range(height):
+            row = list(values[y * width: (y + 1) * width])
+            if width & 1:
+                row.append(row[-1])
+            res += bytes((row[x] << 4) | row[x + 1] for x in range(0, width, 2))
+        return res
+    elif bpp == 8:
+        return bytearray(values)
+    return bytearray(struct.pack('>%d%s' % (len(values), 'H' if bpp == 16 else 'I'), *values))
+
+
+def encodeRGBA32(buffer, width, height):
+    # Each 4x4 block holds 16 AR pairs followed by 16 GB pairs,
+    # so both halves are tiled like a 16-bit format and interleaved by block.
+    count = width * height
+    if np is not None:
+        rgba = np.frombuffer(buffer, dtype=np.uint8, count=count * 4).reshape(count, 4)
+        ar = rgba[:, [3, 0]].tobytes()
+        gb = rgba[:, [1, 2]].tobytes()
+    else:
+        ar = bytearray(count * 2)
+        gb = bytearray(count * 2)
+        ar[0::2], ar[1::2] = buffer[3:count * 4:4], buffer[0:count * 4:4]
+        gb[0::2], gb[1::2] = buffer[1:count * 4:4], buffer[2:count * 4:4]
+
+    ar = swizzle(ar, width, height, NINTEX_RGB565)
+    gb = swizzle(gb, width, height, NINTEX_RGB565)
+
+    if np is not None:
+        blocks = np.stack((np.frombuffer(ar, dtype=np.uint8).reshape(-1, 32), np.frombuffer(gb, dtype=np.uint8).reshape(-1, 32)), axis=1)
+        return bytearray(blocks.tobytes())
+    return bytearray(b''.join(ar[i: i + 32] + gb[i: i + 32] for i in range(0, len(ar), 32)))
+
+
+def quantize(buffer, width, height, dataFormat, pixelFormat):
+    # Palette for an indexed format as raw 16-bit big-endian entries.
+    # Colors are reduced to the palette pixel format first; if there are
+    # still too many, they are split by weighted median cut.
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
+    paletteFormat = pixelFormats[pixelFormat]
+    encoder = pixelEncoders[paletteFormat]
+    values = encodePixels(buffer, width, height, encoder)
+
+    if np is None:
+        counts = {}
+        for v in values:
+            counts[v] = counts.get(v, 0) + 1
+        entries = sorted(counts, key=counts.get, reverse=True)[:paletteLen]
+        return bytearray(struct.pack('>%dH' % paletteLen, *(entries + [0] * (paletteLen - len(entries)))))
+
+    colors, counts = np.unique(values, return_counts=True)
+    if colors.size > paletteLen:
+        rgba = getLookupTable(paletteFormat)[colors].astype(np.int64)
+        span = lambda box: np.ptp(rgba[box], axis=0)
+        boxes = [np.arange(colors.size)]
+        spans = [span(boxes[0])]
+        while len(boxes) < paletteLen:
+            i = max(range(len(boxes)), key=lambda j: spans[j].max())
+            if spans[i].max() == 0:
+                break
+            box = boxes[i]
+            box = box[np.argsort(rgba[box, spans[i].argmax()], kind='stable')]
+            cumulative = np.cumsum(counts[box])
+            split = min(max(int(np.searchsorted(cumulative, cumulative[-1] / 2)), 1), box.size - 1)
+            boxes[i:i + 1] = [box[:split], box[split:]]
+            spans[i:i + 1] = [span(box[:split]), span(box[split:])]
+
+        means = np.array([(rgba[box] * counts[box, None]).sum(axis=0) // counts[box].sum() for box in boxes], dtype=np.uint32)
+        colors = encoder(means[:, 0], means[:, 1], means[:, 2], means[:, 3])
+
+    palette = np.zeros(paletteLen, dtype='>u2')
+    palette[:colors.size] = colors
+    return bytearray(palette.tobytes())
+
+
+def mapToPalette(buffer, width, height, palette):
+    # index of the nearest palette color for each pixel
+    count = width * height
+    entries = len(palette)
+
+    if np is not None:
+        pixels = np.frombuffer(buffer, dtype=np.uint32, count=count)
+        colors, inverse = np.unique(pixels, return_inverse=True)
+        colors = colors.view(np.uint8).reshape(-1, 4).astype(np.float64)
+        palette = palette.astype(np.float64)
+        # |c - p|^2 without the |c|^2 term, which is the same for every entry
+        weights = (palette ** 2).sum(axis=1)
+        nearest = np.empty(colors.shape[0], dtype=np.uint32)
+        for i in range(0, colors.shape[0], 0x4000):
+            nearest[i: i + 0x4000] = (weights - 2 * colors[i: i + 0x4000].dot(palette.T)).argmin(axis=1)
+        return nearest[inverse.ravel()]
+
+    cache = {}
+    res = []
+    for i in range(count):
+        pixel = bytes(buffer[i * 4: i * 4 + 4])
+        if pixel not in cache:
+            cache[pixel] = min(range(entries), key=lambda j: sum((pixel[k] - palette[j][k]) ** 2 for k in range(4)))
+        res.append(cache[pixel])
+    return res
+
+
+class cmprEncoder:
+    # Encodes all 4x4 blocks of an image at once. Blocks are (N, 16, 4)
+    # arrays of RGBA texels; endpoints are (N, 3) float arrays.
+
+    @staticmethod
+    def blocks(buffer, width, height):
+        # pad to the storage size by repeating the edge texels
+        _width, _height = getStorageWH(width, height, NINTEX_CMPR)
+        image = np.frombuffer(buffer, dtype=np.uint8, count=width * height * 4).reshape(height, width, 4)
+        image = np.pad(image, ((0, _height - height), (0, _width - width), (0, 0)), mode='edge')
+        return image.reshape(_height // 4, 4, _width // 4, 4, 4).transpose(0, 2, 1, 3, 4).reshape(-1, 16, 4)
+
+    @staticmethod
+    def boundingBox(colors):
+        return colors.max(axis=1), colors.min(axis=1)
+
+    @staticmethod
+    def principalAxis(colors):
+        mean = colors.mean(axis=1, keepdims=True)
+        centered = colors - mean
+        cov = np.einsum('nki,nkj->nij', centered, centered)
+        # power iteration, starting from the bounding box diagonal
+        axis = colors.max(axis=1) - colors.min(axis=1) + 1e-3
+        for i in range(8):
+            axis = np.einsum('nij,nj->ni', cov, axis)
+            axis /= np.maximum(np.linalg.norm(axis, axis=1, keepdims=True), 1e-9)
+        t = np.einsum('nki,ni->nk', centered, axis)
+        mean = mean[:, 0]
+        return np.clip(mean + axis * t.max(axis=1, keepdims=True), 0, 255), np.clip(mean + axis * t.min(axis=1, keepdims=True), 0, 255)
+
+    @staticmethod
+    def refine(colors, c0, c1, opaque, iterations=3):
+        # Least squares fit of the endpoints to the current index assignment
+        weights4 = np.array([1., 0., 2. / 3, 1. / 3])
+        weights3 = np.array([1., 0., .5, 0.])
+        indices, best = cmprEncoder.fit(colors, c0, c1, opaque)
+        for i in range(iterations):
+            w = np.where(opaque[:, None], weights4[indices], weights3[indices])
+            v = 1 - w
+            aa = (w * w).sum(axis=1)[:, None]
+            bb = (v * v).sum(axis=1)[:, None]
+            ab = (w * v).sum(axis=1)[:, None]
+            ax = np.einsum('nk,nki->ni', w, colors)
+            bx = np.einsum('nk,nki->ni', v, colors)
+            det = aa * bb - ab * ab
+            ok = np.abs(det) > 1e-6
+            det = np.where(ok, det, 1)
+            n0 = np.clip(np.where(ok, (ax * bb - bx * ab) / det, c0), 0, 255)
+            n1 = np.clip(np.where(ok, (bx * aa - ax * ab) / det, c1), 0, 255)
+
+            newIndices, error = cmprEncoder.fit(colors, n0, n1, opaque)
+            better = error < best
+            c0 = np.where(better[:, None], n0, c0)
+            c1 = np.where(better[:, None], n1, c1)
+            indices = np.where(better[:, None], newIndices, indices)
+            best = np.minimum(error, best)
+        return c0, c1
+
+    @staticmethod
+    def endpoints(c0, c1, opaque):
+        # 565 endpoints ordered for 4-color (opaque) or 3-color mode
+        e0 = pixelParser.to_rgb565(*np.rint(c0).astype(np.uint32).T)
+        e1 = pixelParser.to_rgb565(*np.rint(c1).astype(np.uint32).T)
+        swap = np.where(opaque, e0 < e1, e0 > e1)
+        return np.where(swap, e1, e0), np.where(swap, e0, e1)
+
+    @staticmethod
+    def palette(e0, e1):
+        # same as the decoder in textureParser.cmpr
+        table = getLookupTable(NINTEX_RGB565).astype(np.int32)
+        p0 = table[e0]
+        p1 = table[e1]
+        four = (e0 > e1)[:, None]
+        p2 = np.where(four, (2 * p0 + p1) // 3, (p0 + p1) // 2)
+        p3 = np.where(four, (2 * p1 + p0) // 3, 0)
+        return np.stack((p0, p1, p2, p3), axis=1)
+
+    @staticmethod
+    def fit(colors, c0, c1, opaque):
+        # indices and total squared error of each block for the given endpoints
+        e0, e1 = cmprEncoder.endpoints(c0, c1, opaque)
+        indices, d = cmprEncoder.assign(colors, cmprEncoder.palette(e0, e1), opaque)
+        return indices, d.sum(axis=1)
+
+    @staticmethod
+    def assign(colors, palette, opaque):
+        # nearest palette color of each texel, index 3 is transparent in 3-color blocks
+        d = ((colors[:, :, None, :3] - palette[:, None, :, :3]) ** 2).sum(axis=3)
+        d[:, :, 3] = np.where(opaque[:, None], d[:, :, 3], np.inf)
+        indices = d.argmin(axis=2)
+        return indices, d.min(axis=2)
+
+
+def encodeCMPR(buffer, width, height, quality=None):
+    if quality is None:
+        quality = cmprQuality
+
+    if np is None:
+        # let Noesis do the block compression
+        dxt = rapi.imageEncodeDXT(buffer, 4, width, height, noesis.NOE_ENCODEDXT_BC1)
+        return dxt1ToCMPR(dxt, width, height)
+
+    blocks = cmprEncoder.blocks(buffer, width, height)
+    colors = blocks[:, :, :3].astype(np.float64)
+    transparent = blocks[:, :, 3] < 0x80
+    opaque = ~transparent.any(axis=1)
+
+    # endpoints are fitted to the visible texels only
+    first = np.where(transparent.all(axis=1, keepdims=True), 0, (~transparent).argmax(axis=1)[:, None])
+    visible = np.where(transparent[:, :, None], np.take_along_axis(colors, first[:, :, None], axis=1), colors)
+
+    if quality == NINTEX_CMPR_FAST:
+        c0, c1 = cmprEncoder.boundingBox(visible)
+    else:
+        c0, c1 = cmprEncoder.principalAxis(visible)
+        if quality == NINTEX_CMPR_REFINE:
+            c0, c1 = cmprEncoder.refine(visible, c0, c1, opaque)
+
+    e0, e1 = cmprEncoder.endpoints(c0, c1, opaque)
+    indices = cmprEncoder.assign(visible, cmprEncoder.palette(e0, e1), opaque)[0]
+    indices = np.where(transparent, 3, indices).reshape(-1, 4, 4)
+
+    res = np.empty((blocks.shape[0], 8), dtype=np.uint8)
+    res[:, 0:2] = e0.astype('>u2').view(np.uint8).reshape(-1, 2)
+    res[:, 2:4] = e1.astype('>u2').view(np.uint8).reshape(-1, 2)
+    res[:, 4:8] = (indices[:, :, 0] << 6) | (indices[:, :, 1] << 4) | (indices[:, :, 2] << 2) | indices[:, :, 3]
+
+    _width, _height = getStorageWH(width, height, NINTEX_CMPR)
+    res = res.reshape(_height // 8, 2, _width // 8, 2, 8).transpose(0, 2, 1, 3, 4)
+    return bytearray(res.tobytes())
+
+
+def isEncodable(dataFormat):
+    return dataFormat in (NINTEX_RGBA32, NINTEX_CMPR, NINTEX_RGB565, NINTEX_C4, NINTEX_C8) or dataFormat in pixelEncoders
 
 
 def encode(buffer, width, height, dataFormat, palette=None, pixelFormat=None):
-    if dataFormat != NINTEX_RGB565:
-        raise ValueError("Data format not supported!")
+    # RGBA32 image to raw tiled data. Indexed formats need a palette,
+    # see quantize.
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
 
-    res = rapi.swapEndianArray(rapi.imageEncodeRaw(buffer, width, height, "b5g6r5"), 2)
+    if dataFormat == NINTEX_RGBA32:
+        return encodeRGBA32(buffer, width, height)
 
-    # res = NoeBitStream(bigEndian=NOE_BIGENDIAN)
-    # for i in range(height * width):
-    #     res.writeUShort(pixelParser.to_rgb565(buffer[4*i+0], buffer[4*i+1], buffer[4*i+2], buffer[4*i+3]))
+    elif dataFormat == NINTEX_CMPR:
+        return encodeCMPR(buffer, width, height)
+
+    elif dataFormat == NINTEX_RGB565:
+        res = rapi.swapEndianArray(rapi.imageEncodeRaw(buffer, width, height, "b5g6r5"), 2)
+
+    elif dataFormat in pixelEncoders:
+        res = packPixels(encodePixels(buffer, width, height, pixelEncoders[dataFormat]), width, height, bpp)
+
+    elif dataFormat in (NINTEX_C4, NINTEX_C8):
+        if palette is None:
+            raise ValueError("Palette is required for format " + name)
+        entries = min(len(palette) // 2, paletteLen)
+        indices = mapToPalette(buffer, width, height, expandPalette(palette, pixelFormat, entries))
+        res = packPixels(indices, width, height, bpp)
+
+    else:
+        raise ValueError("Data format not supported!")
 
     return swizzle(res, width, height, dataFormat)
 
 
+def getSourceView(bs, size):
+    # The stream's data without copying it when the stream exposes it
+    data = getattr(bs, 'data', None)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return memoryview(data)[bs.tell(): bs.tell() + size]
+    return bs.getBuffer(bs.tell(), bs.tell() + size)
+
+
+cacheEntries = collections.OrderedDict()
+cacheLock = threading.Lock()
+cacheStats = {'hits': 0, 'diskHits': 0, 'misses': 0, 'memoryBytes': 0, 'diskBytes': None}
+cacheHeader = struct.Struct('<4sIIII')
+
+
+def getCacheKey(buffer, width, height, dataFormat, palette=None, pixelFormat=None):
+    h = hashlib.sha1(struct.pack('<IIIiiII', NINTEX_VERSION, width, height, dataFormat,
+                                 -1 if pixelFormat is None else pixelFormat, cmprAsDXT1, opaqueAsRGB24))
+    if palette is not None:
+        h.update(struct.pack('<I', len(palette)))
+        h.update(palette)
+    h.update(buffer)
+    return h.hexdigest()
+
+
+def getCacheFile(key):
+    return os.path.join(cachePath, key + '.ntxcache')
+
+
+def getDiskCacheSize():
+    if cacheStats['diskBytes'] is None:
+        cacheStats['diskBytes'] = sum(os.path.getsize(x) for x in getDiskCacheFiles())
+    return cacheStats['diskBytes']
+
+
+def getDiskCacheFiles():
+    return [os.path.join(cachePath, x) for x in os.listdir(cachePath) if x.endswith('.ntxcache')]
+
+
+def readCacheFile(key):
+    try:
+        with open(getCacheFile(key), 'rb') as f:
+            data = f.read()
+        os.utime(getCacheFile(key), None)
+    except (IOError, OSError):
+        return None
+
+    if len(data) < cacheHeader.size:
+        return None
+    magic, width, height, pixelType, size = cacheHeader.unpack_from(data)
+    if magic != b'NTXC' or len(data) != cacheHeader.size + size:
+        return None
+    return width, height, pixelType, bytearray(memoryview(data)[cacheHeader.size:])
+
+
+def writeCacheFile(key, entry):
+    width, height, pixelType, pixelData = entry
+    try:
+        if not os.path.isdir(cachePath):
+            os.makedirs(cachePath)
+        diskBytes = getDiskCacheSize()
+        with open(getCacheFile(key), 'wb') as f:
+            f.write(cacheHeader.pack(b'NTXC', width, height, pixelType, len(pixelData)))
+            f.write(pixelData)
+        diskBytes += cacheHeader.size + len(pixelData)
+
+        if diskBytes > cacheDiskBytes:
+            # evict least recently used files (hits touch the file)
+            files = sorted(getDiskCacheFiles(), key=os.path.getmtime)
+            while diskBytes > cacheDiskBytes and files:
+                name = files.pop(0)
+                diskBytes -= os.path.getsize(name)
+                os.remove(name)
+        cacheStats['diskBytes'] = diskBytes
+    except (IOError, OSError):
+        # a read-only or full disk only costs the cache
+        cacheStats['diskBytes'] = None
+
+
+def storeCacheEntry(key, entry):
+    size = len(entry[3])
+    if size > cacheMemoryBytes:
+        return
+    with cacheLock:
+        if key in cacheEntries:
+            return
+        cacheEntries[key] = entry
+        cacheStats['memoryBytes'] += size
+        while cacheStats['memoryBytes'] > cacheMemoryBytes and cacheEntries:
+            oldKey, oldEntry = cacheEntries.popitem(last=False)
+            cacheStats['memoryBytes'] -= len(oldEntry[3])
+
+
+def convertCached(buffer, width, height, dataFormat, palette=None, pixelFormat=None):
+    # convert() through the decoded texture cache. The cache keeps the returned
+    # pixelData bytearray itself, so it must not be modified in place.
+    if cacheMemoryBytes <= 0 and cachePath is None:
+        return convert(buffer, width, height, dataFormat, palette, pixelFormat)
+
+    key = getCacheKey(buffer, width, height, dataFormat, palette, pixelFormat)
+    with cacheLock:
+        entry = cacheEntries.get(key)
+        if entry is not None:
+            cacheEntries.move_to_end(key)
+            cacheStats['hits'] += 1
+    if entry is None:
+        entry = readCacheFile(key) if cachePath is not None else None
+        if entry is not None:
+            cacheStats['diskHits'] += 1
+        else:
+            cacheStats['misses'] += 1
+            tex = convert(buffer, width, height, dataFormat, palette, pixelFormat)
+            entry = (tex.width, tex.height, tex.pixelType, tex.pixelData)
+            if cachePath is not None:
+                writeCacheFile(key, entry)
+            storeCacheEntry(key, entry)
+            return tex
+        storeCacheEntry(key, entry)
+
+    width, height, pixelType, pixelData = entry
+    return NoeTexture("default", width, height, pixelData, pixelType)
+
+
+def getCacheStats():
+    return dict(cacheStats, entries=len(cacheEntries))
+
+
+def clearCache(disk=False):
+    # Empty the in-memory cache (and the on-disk store if disk is set) and reset the counters
+    with cacheLock:
+        cacheEntries.clear()
+    if disk and cachePath is not None and os.path.isdir(cachePath):
+        for name in getDiskCacheFiles():
+            os.remove(name)
+    cacheStats.update(hits=0, diskHits=0, misses=0, memoryBytes=0, diskBytes=None)
+
+
 def readTexture(bs, width, height, dataFormat, palette=None, pixelFormat=None):
     size = getTextureSizeInBytes(width, height, dataFormat)
-    tex = bs.getBuffer(bs.tell(), bs.tell() + size)
-    return convert(tex, width, height, dataFormat, palette, pixelFormat)
+    tex = getSourceView(bs, size)
+    return convertCached(tex, width, height, dataFormat, palette, pixelFormat)
+
+
+def readTextures(descriptors, workers=None):
+    # Decode a batch of textures, each described by a tuple of convert's arguments:
+    # (buffer, width, height, dataFormat[, palette, pixelFormat]).
+    # Decodes share scratch memory sized for the largest texture; with workers > 0
+    # they run in that many threads. Textures are returned in input order.
+    workers = batchWorkers if workers is None else workers
+    descriptors = [tuple(x) for x in descriptors]
+    if not descriptors:
+        return []
+    workers = min(workers, len(descriptors)) if ThreadPoolExecutor is not None else 0
+
+    buffers = []
+    if np is not None:
+        size = max(getScratchSize(x[1], x[3]) for x in descriptors)
+        buffers = [scratchBuffer(size) for i in range(max(workers, 1))]
+
+    def decode(descriptor):
+        scratch = buffers.pop() if buffers else None
+        scratchLocal.buffer = scratch
+        try:
+            return convertCached(*descriptor)
+        finally:
+            scratchLocal.buffer = None
+            if scratch is not None:
+                buffers.append(scratch)
+
+    if workers > 1:
+        with ThreadPoolExecutor(workers) as pool:
+            return list(pool.map(decode, descriptors))
+    return [decode(x) for x in descriptors]
+
+
+sharedTextureData = None
+
+
+def initTextureWorker(name, size, options):
+    # Worker: attach the shared source and take over the parent's output options
+    global sharedTextureData, sharedTextureBlock, cmprAsDXT1, opaqueAsRGB24
+    sharedTextureBlock = attachSharedMemory(name)
+    sharedTextureData = sharedTextureBlock.buf[:size]
+    cmprAsDXT1, opaqueAsRGB24 = options
+
+
+def decodeSharedTexture(descriptor):
+    # Worker: (width, height, pixelData, pixelType) of a texture at an offset of the shared source
+    offset, width, height, dataFormat, palette, pixelFormat = descriptor
+    size = getTextureSizeInBytes(width, height, dataFormat)
+    tex = convert(sharedTextureData[offset: offset + size], width, height, dataFormat, palette, pixelFormat)
+    return tex.width, tex.height, bytes(tex.pixelData), tex.pixelType
+
+
+def readTexturesParallel(data, descriptors, workers):
+    # readTextures for textures of one buffer, in a pool of worker processes sharing it.
+    # descriptors are (offset, width, height, dataFormat, palette, pixelFormat) tuples.
+    # Falls back to readTextures if the pool can't be used.
+    descriptors = [tuple(x) for x in descriptors]
+    res = None
+
+    if workers > 0 and len(descriptors) > 1 and canUseProcessPool() and shared_memory is not None:
+        block = None
+        try:
+            block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+            block.buf[:len(data)] = data
+            with ProcessPoolExecutor(min(workers, len(descriptors)), initializer=initTextureWorker,
+                                     initargs=(block.name, len(data), (cmprAsDXT1, opaqueAsRGB24))) as pool:
+                res = [NoeTexture("default", *x) for x in pool.map(decodeSharedTexture, descriptors)]
+        except (OSError, RuntimeError, BrokenProcessPool):
+            # embedded interpreters can't always spawn workers
+            disableProcessPool()
+            res = None
+        finally:
+            if block is not None:
+                block.close()
+                block.unlink()
+
+    if res is None:
+        data = memoryview(data)
+        res = readTextures([(data[x[0]: x[0] + getTextureSizeInBytes(x[1], x[2], x[3])],) + x[1:] for x in descriptors])
+    return res
+
+
+def getRegionSource(buffer, width, height, dataFormat, x, y, regionWidth, regionHeight):
+    # Tiles covering a tile-aligned region, laid out as a texture of their own.
+    # Tiles outside the region are skipped.
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
+    if x % bw or y % bh:
+        raise ValueError("Region must start at a {}x{} tile boundary".format(bw, bh))
+
+    _width, _height = getStorageWH(width, height, dataFormat)
+    tileSize = bw * bh * bpp // 8
+    tilesX = _width // bw
+    tx0, ty0 = x // bw, y // bh
+    tx1 = (x + regionWidth + bw - 1) // bw
+    ty1 = (y + regionHeight + bh - 1) // bh
+    rowSize = (tx1 - tx0) * tileSize
+
+    if np is not None:
+        size = _width * _height * bpp // 8
+        if len(buffer) < size:
+            buffer = bytes(buffer) + bytes(size - len(buffer))
+        tiles = np.frombuffer(buffer, dtype=np.uint8, count=size).reshape(-1, tilesX, tileSize)
+        return tiles[ty0:ty1, tx0:tx1].tobytes()
+
+    return b''.join(buffer[(ty * tilesX + tx0) * tileSize: (ty * tilesX + tx0) * tileSize + rowSize] for ty in range(ty0, ty1))
+
+
+def getRegionSize(width, height, x, y, regionWidth, regionHeight):
+    # Region size clipped to the texture
+    regionWidth = min(regionWidth, width - x)
+    regionHeight = min(regionHeight, height - y)
+    if x < 0 or y < 0 or regionWidth <= 0 or regionHeight <= 0:
+        raise ValueError("Region must overlap the {}x{} texture".format(width, height))
+    return regionWidth, regionHeight
+
+
+def convertRegion(buffer, width, height, dataFormat, x, y, regionWidth, regionHeight, palette=None, pixelFormat=None):
+    regionWidth, regionHeight = getRegionSize(width, height, x, y, regionWidth, regionHeight)
+    tex = getRegionSource(buffer, width, height, dataFormat, x, y, regionWidth, regionHeight)
+    return convert(tex, regionWidth, regionHeight, dataFormat, palette, pixelFormat)
+
+
+def decodeRegion(buffer, width, height, dataFormat, x, y, regionWidth, regionHeight, palette=None, pixelFormat=None):
+    # RGBA32 pixel data of a region, whatever cmprAsDXT1 and opaqueAsRGB24 are set to
+    regionWidth, regionHeight = getRegionSize(width, height, x, y, regionWidth, regionHeight)
+    tex = getRegionSource(buffer, width, height, dataFormat, x, y, regionWidth, regionHeight)
+    return decodeRGBA(tex, regionWidth, regionHeight, dataFormat, palette, pixelFormat)
+
+
+def readTextureRegion(bs, width, height, dataFormat, x, y, regionWidth, regionHeight, palette=None, pixelFormat=None):
+    # Decode only the tiles of a region whose top-left corner is on a tile boundary
+    size = getTextureSizeInBytes(width, height, dataFormat)
+    tex = getSourceView(bs, size)
+    return convertRegion(tex, width, height, dataFormat, x, y, regionWidth, regionHeight, palette, pixelFormat)
+
+
+def sampleTexels(src, width, height, dataFormat, scale, palette):
+    # Point-sample every scale-th texel straight from the tiled source
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
+    tilesX = (width + bw - 1) // bw
+    tileSize = bw * bh * bpp // 8
+    X = np.arange(0, width, scale)[None, :]
+    Y = np.arange(0, height, scale)[:, None]
+    tile = (Y // bh * tilesX + X // bw) * tileSize
+    texel = Y % bh * bw + X % bw
+
+    textureData, rgba = vectorParser.rgbaBuffer(X.size, Y.size)
+
+    if dataFormat == NINTEX_RGBA32:
+        base = tile + (Y % 4 * 4 + X % 4) * 2
+        rgba[:, :, 0] = src[base + 1]
+        rgba[:, :, 1] = src[base + 32]
+        rgba[:, :, 2] = src[base + 33]
+        rgba[:, :, 3] = src[base]
+        return textureData
+
+    if dataFormat == NINTEX_CMPR:
+        # mean of the endpoint colors of the sampled block; indices are never read
+        base = tile + ((Y % 8 // 4) * 2 + X % 8 // 4) * 8
+        table = getLookupTable(NINTEX_RGB565)
+        c0 = table[(src[base].astype(np.uint16) << 8) | src[base + 1]].astype(np.uint16)
+        c1 = table[(src[base + 2].astype(np.uint16) << 8) | src[base + 3]].astype(np.uint16)
+        rgba[:] = (c0 + c1) // 2
+        return textureData
+
+    if bpp == 16:
+        raw = np.empty((Y.size, X.size * 2), dtype=np.uint8)
+        raw[:, 0::2] = src[tile + texel * 2]
+        raw[:, 1::2] = src[tile + texel * 2 + 1]
+    elif bpp == 8:
+        raw = src[tile + texel]
+    else:
+        v = (src[tile + texel // 2] >> ((1 - texel % 2) * 4)) & 0xF
+        if X.size & 1:
+            v = np.concatenate((v, v[:, -1:]), axis=1)
+        raw = ((v[:, 0::2] << 4) | v[:, 1::2]).astype(np.uint8)
+
+    if paletteLen:
+        vectorParser.indexed(raw, rgba, palette, bpp)
+    else:
+        vectorDecoders[dataFormat](raw, rgba)
+    return textureData
+
+
+def convertThumbnail(buffer, width, height, dataFormat, scale, palette=None, pixelFormat=None):
+    # 1/scale image made of every scale-th texel. CMPR thumbnails at 1/4 and
+    # 1/8 use only the block endpoint colors.
+    if scale not in (1, 2, 4, 8):
+        raise ValueError("Thumbnail scale must be 1, 2, 4 or 8")
+
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
+    thumbWidth = (width + scale - 1) // scale
+    thumbHeight = (height + scale - 1) // scale
+
+    if scale == 1:
+        return convert(buffer, width, height, dataFormat, palette, pixelFormat)
+
+    if np is None or (dataFormat == NINTEX_CMPR and scale < 4):
+        # subsampled from a full RGBA32 decode, whatever the output options are
+        pixelData = decodeRGBA(buffer, width, height, dataFormat, palette, pixelFormat)
+        textureData = bytearray(thumbWidth * thumbHeight * 4)
+        for y in range(thumbHeight):
+            for x in range(thumbWidth):
+                src = (y * scale * width + x * scale) * 4
+                dst = (y * thumbWidth + x) * 4
+                textureData[dst: dst + 4] = pixelData[src: src + 4]
+        return NoeTexture("default", thumbWidth, thumbHeight, textureData, noesis.NOESISTEX_RGBA32)
+
+    src, palette = getDecodeSource(buffer, width, height, dataFormat, palette, pixelFormat)
+    textureData = sampleTexels(src, width, height, dataFormat, scale, palette)
+    return NoeTexture("default", thumbWidth, thumbHeight, textureData, noesis.NOESISTEX_RGBA32)
+
+
+def readThumbnail(bs, width, height, dataFormat, scale, palette=None, pixelFormat=None):
+    size = getTextureSizeInBytes(width, height, dataFormat)
+    tex = getSourceView(bs, size)
+    return convertThumbnail(tex, width, height, dataFormat, scale, palette, pixelFormat)
+
+
+class MipLevel:
+    # One level of a mip chain. The texture is decoded on first access.
+    def __init__(self, buffer, level, offset, width, height, dataFormat, palette=None, pixelFormat=None):
+        self.buffer = buffer
+        self.level = level
+        self.offset = offset
+        self.width = width
+        self.height = height
+        self.dataFormat = dataFormat
+        self.palette = palette
+        self.pixelFormat = pixelFormat
+        self.size = getTextureSizeInBytes(width, height, dataFormat)
+        self.decoded = None
+
+    @property
+    def texture(self):
+        if self.decoded is None:
+            tex = self.buffer[self.offset: self.offset + self.size]
+            self.decoded = convertCached(tex, self.width, self.height, self.dataFormat, self.palette, self.pixelFormat)
+        return self.decoded
+
+
+def getMipChain(width, height, dataFormat, levels):
+    # (offset, width, height) of each level, relative to the start of level 0
+    res = []
+    offset = 0
+    for i in range(max(levels, 1)):
+        res.append((offset, width, height))
+        offset += getTextureSizeInBytes(width, height, dataFormat)
+        if width == 1 and height == 1:
+            break
+        width = max(width >> 1, 1)
+        height = max(height >> 1, 1)
+    return res
+
+
+def getMipChainSizeInBytes(width, height, dataFormat, levels):
+    offset, width, height = getMipChain(width, height, dataFormat, levels)[-1]
+    return offset + getTextureSizeInBytes(width, height, dataFormat)
+
+
+def readMipChain(bs, width, height, dataFormat, levels, palette=None, pixelFormat=None):
+    # Levels that are not fully present in the stream are dropped.
+    # Nothing is decoded until a level's texture is accessed.
+    size = min(getMipChainSizeInBytes(width, height, dataFormat, levels), bs.getSize() - bs.tell())
+    buffer = getSourceView(bs, size)
+
+    res = []
+    for i, (offset, w, h) in enumerate(getMipChain(width, height, dataFormat, levels)):
+        if offset + getTextureSizeInBytes(w, h, dataFormat) > size:
+            break
+        res.append(MipLevel(buffer, i, offset, w, h, dataFormat, palette, pixelFormat))
+    return res
 
 
 def writeTexture(buffer, width, height, dataFormat, palette=None, pixelFormat=None):
@@ -359,34 +1817,507 @@ def getPaletteSizeInBytes(dataFormat, paletteLenOverride = 0):
         paletteLen = paletteLenOverride
     return paletteLen * 2  # palettes are always 16-bpp
 
-    
+
+
+def expand5(x):
+    return ((x & 0x1F) << 3) | ((x & 0x1F) >> 2)
+
+
+def expand6(x):
+    return ((x & 0x3F) << 2) | ((x & 0x3F) >> 4)
+
+
+class picaParser:
+    # 3DS texel value (little-endian) to (r, g, b, a).
+    # Works on ints and on NumPy arrays of uint32 alike.
+
+    @staticmethod
+    def rgba8(v):
+        return (v >> 24) & 0xFF, (v >> 16) & 0xFF, (v >> 8) & 0xFF, v & 0xFF
+
+    @staticmethod
+    def rgb8(v):
+        return (v >> 16) & 0xFF, (v >> 8) & 0xFF, v & 0xFF, 0xFF
+
+    @staticmethod
+    def rgba5551(v):
+        return expand5(v >> 11), expand5(v >> 6), expand5(v >> 1), (v & 1) * 0xFF
+
+    @staticmethod
+    def rgb565(v):
+        return expand5(v >> 11), expand6(v >> 5), expand5(v), 0xFF
+
+    @staticmethod
+    def rgba4(v):
+        return ((v >> 12) & 0xF) * 0x11, ((v >> 8) & 0xF) * 0x11, ((v >> 4) & 0xF) * 0x11, (v & 0xF) * 0x11
+
+    @staticmethod
+    def la8(v):
+        return (v >> 8) & 0xFF, (v >> 8) & 0xFF, (v >> 8) & 0xFF, v & 0xFF
+
+    @staticmethod
+    def hilo8(v):
+        return (v >> 8) & 0xFF, v & 0xFF, 0, 0xFF
+
+    @staticmethod
+    def l8(v):
+        return v, v, v, 0xFF
+
+    @staticmethod
+    def a8(v):
+        return 0, 0, 0, v
+
+    @staticmethod
+    def la4(v):
+        return (v >> 4) * 0x11, (v >> 4) * 0x11, (v >> 4) * 0x11, (v & 0xF) * 0x11
+
+    @staticmethod
+    def l4(v):
+        return v * 0x11, v * 0x11, v * 0x11, 0xFF
+
+    @staticmethod
+    def a4(v):
+        return 0, 0, 0, v * 0x11
+
+
+picaFormats = {
+    # code: name, decoder, bpp
+    0x0: ("rgba8",    picaParser.rgba8,    32),
+    0x1: ("rgb8",     picaParser.rgb8,     24),
+    0x2: ("rgba5551", picaParser.rgba5551, 16),
+    0x3: ("rgb565",   picaParser.rgb565,   16),
+    0x4: ("rgba4",    picaParser.rgba4,    16),
+    0x5: ("la8",      picaParser.la8,      16),
+    0x6: ("hilo8",    picaParser.hilo8,    16),
+    0x7: ("l8",       picaParser.l8,        8),
+    0x8: ("a8",       picaParser.a8,        8),
+    0x9: ("la4",      picaParser.la4,       8),
+    0xA: ("l4",       picaParser.l4,        4),
+    0xB: ("a4",       picaParser.a4,        4),
+}
+
+# 3DS textures are made of 8x8 tiles with Z-ordered texels;
+# mortonOrder[y * 8 + x] is the position of texel x, y in its tile
+mortonOrder = tuple(
+    sum(((x >> i) & 1) << (2 * i) | ((y >> i) & 1) << (2 * i + 1) for i in range(3))
+    for y in range(8) for x in range(8))
+
+# PICA200 format -> RGBA table of every texel value, for formats up to 16 bpp
+picaTables = {}
+
+
+def getPICATable(picaFormat):
+    if picaFormat not in picaTables:
+        name, decoder, bpp = picaFormats[picaFormat]
+        table = np.empty((1 << bpp, 4), dtype=np.uint8)
+        for i, channel in enumerate(decoder(np.arange(1 << bpp, dtype=np.uint32))):
+            table[:, i] = channel
+        picaTables[picaFormat] = table
+    return picaTables[picaFormat]
+
+
+def getPICATextureSizeInBytes(width, height, picaFormat):
+    name, decoder, bpp = picaFormats[picaFormat]
+    return ((width + 7) // 8 * 8) * ((height + 7) // 8 * 8) * bpp // 8
+
+
+def unswizzlePICA(buffer, width, height, picaFormat):
+    # Texel values of a 3DS texture, row-major, as a (height, width) uint32 array
+    name, decoder, bpp = picaFormats[picaFormat]
+    _width, _height = (width + 7) // 8 * 8, (height + 7) // 8 * 8
+    size = getPICATextureSizeInBytes(width, height, picaFormat)
+    if len(buffer) < size:
+        buffer = bytes(buffer) + bytes(size - len(buffer))
+    src = np.frombuffer(buffer, dtype=np.uint8, count=size)
+
+    if bpp == 4:
+        # low nibble first
+        texels = np.empty(size * 2, dtype=np.uint8)
+        texels[0::2] = src & 0xF
+        texels[1::2] = src >> 4
+        src = texels
+    texelSize = max(bpp // 8, 1)
+
+    # all tiles at once: gather each tile's texels into row-major order, then lay the tiles out
+    tiles = src.reshape(_height // 8, _width // 8, 64, texelSize)[:, :, np.array(mortonOrder)]
+    texels = tiles.reshape(_height // 8, _width // 8, 8, 8, texelSize).transpose(0, 2, 1, 3, 4)
+    texels = texels.reshape(_height, _width, texelSize)[:height, :width]
+
+    res = np.zeros((height, width), dtype=np.uint32)
+    for i in range(texelSize):
+        res |= texels[:, :, i].astype(np.uint32) << (8 * i)
+    return res
+
+
+def convertPICA(buffer, width, height, picaFormat):
+    # 3DS (PICA200) texture to RGBA32. Images are stored bottom-up on the 3DS; they are not flipped here.
+    name, decoder, bpp = picaFormats[picaFormat]
+
+    if np is not None:
+        values = unswizzlePICA(buffer, width, height, picaFormat)
+        if bpp <= 16:
+            rgba = getPICATable(picaFormat)[values]
+        else:
+            rgba = np.empty((height, width, 4), dtype=np.uint8)
+            for i, channel in enumerate(decoder(values)):
+                rgba[:, :, i] = channel
+        return NoeTexture("default", width, height, bytearray(rgba.tobytes()), noesis.NOESISTEX_RGBA32)
+
+    size = getPICATextureSizeInBytes(width, height, picaFormat)
+    buffer = bytes(buffer[:size]) + bytes(max(size - len(buffer), 0))
+    tilesX = (width + 7) // 8
+    texelSize = bpp // 8
+    textureData = bytearray(width * height * 4)
+    for y in range(height):
+        for x in range(width):
+            i = (y // 8 * tilesX + x // 8) * 64 + mortonOrder[(y & 7) * 8 + (x & 7)]
+            if bpp == 4:
+                v = (buffer[i >> 1] >> ((i & 1) * 4)) & 0xF
+            else:
+                v = int.from_bytes(buffer[i * texelSize: (i + 1) * texelSize], 'little')
+            textureData[(y * width + x) * 4: (y * width + x + 1) * 4] = bytes(decoder(v))
+    return NoeTexture("default", width, height, textureData, noesis.NOESISTEX_RGBA32)
+
+
+def readPICATexture(bs, width, height, picaFormat):
+    size = getPICATextureSizeInBytes(width, height, picaFormat)
+    return convertPICA(getSourceView(bs, size), width, height, picaFormat)
+
+
+moduleImported = False
+if preloadTables:
+    for dataFormat in pixelFormats.values():
+        getLookupTable(dataFormat)
+moduleImported = True
+
+
 def registerNoesisTypes():
     handle = noesis.register("Nintendo Texture Finder", ".nintex")
-    noesis.setHandlerTypeCheck(handle, lambda x: 1)
+    noesis.setHandlerTypeCheck(handle, nintexCheckType)
     noesis.setHandlerLoadRGBA(handle, nintexLoadRGBA)
     return 1
     
     
-def nintexLoadRGBA(data, texList):
-    width = 256
+def scoreImage(pixelData, width, height):
+    # Plausibility of a decoded candidate: how much smoother neighbouring
+    # texels are than texels half the image apart. Noise and wrong widths
+    # score near 0, flat images score 0, real images approach 1.
+    if np is not None:
+        rgba = np.frombuffer(pixelData, dtype=np.uint8).reshape(height, width, 4)
+        return scoreLuma(sumChannels(rgba, 3))
+
+    # same metric in plain Python
+    if height < 2 or width < 2:
+        return 0.
+    luma = [sum(pixelData[i: i + 3]) for i in range(0, width * height * 4, 4)]
+    n = len(luma)
+    mean = sum(luma) / float(n)
+    if sum((x - mean) ** 2 for x in luma) / n < 1:
+        return 0.
+    rows = [luma[y * width: (y + 1) * width] for y in range(height)]
+    vertical = sum(abs(a - b) for row, below in zip(rows, rows[1:]) for a, b in zip(row, below)) / float(n - width)
+    horizontal = sum(abs(a - b) for row in rows for a, b in zip(row, row[1:])) / float(n - height)
+    neighbours = (vertical + horizontal) / 2
+    dx, dy = width // 2, height // 2
+    rolled = [row[-dx:] + row[:-dx] for row in rows[-dy:] + rows[:-dy]]
+    distant = sum(abs(a - b) for row, other in zip(rows, rolled) for a, b in zip(row, other)) / float(n)
+    return max(0., 1 - neighbours / max(distant, 1e-6))
+
+
+def sumChannels(texels, channels=4):
+    # Sum of the first channels of a (height, width, 4) uint8 texel array, as float32;
+    # adding channel planes is much faster than sum(axis=2)
+    res = texels[:, :, 0].astype(np.float32)
+    for i in range(1, channels):
+        res += texels[:, :, i]
+    return res
 
-    bs = NoeBitStream(data, NOE_BIGENDIAN)
-    # newbs = NoeBitStream()
-    # for i in range(bs.getSize() // 8):
-    #     newbs.writeUInt64(bs.readUInt64())
-    # bs = NoeBitStream(newbs.getBuffer(0x10, newbs.getSize()), NOE_BIGENDIAN)
 
-    texList.append(NoeTexture("dxt1", width, (bs.getSize() // width) & 0xFFFFFFFC, bs.getBuffer(), noesis.NOESISTEX_DXT1))
-    texList.append(NoeTexture("dxt3", width, (bs.getSize() // width) & 0xFFFFFFFC, bs.getBuffer(), noesis.NOESISTEX_DXT3))
-    texList.append(NoeTexture("dxt5", width, (bs.getSize() // width) & 0xFFFFFFFC, bs.getBuffer(), noesis.NOESISTEX_DXT5))
+def scoreLuma(luma):
+    # scoreImage of a (height, width) brightness array
+    height, width = luma.shape
+    if height < 2 or width < 2 or luma.std() < 1:
+        return 0.
+    neighbours = (np.abs(np.diff(luma, axis=0)).mean() + np.abs(np.diff(luma, axis=1)).mean()) / 2
+    distant = np.abs(luma - np.roll(np.roll(luma, height // 2, axis=0), width // 2, axis=1)).mean()
+    return max(0., 1 - neighbours / max(distant, 1e-6))
 
-    for dataFormat in dataFormats:
+
+def getCandidateHeight(size, width, offset, dataFormat):
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
+    _width = (width + bw - 1) // bw * bw
+    return (size - offset) * 8 // (_width * bpp) // bh * bh
+
+
+finderData = None
+
+
+def initFinderWorker(data):
+    global finderData
+    finderData = data
+
+
+def getTileSeams(luma, size, axis):
+    # Texel differences across each tile boundary along an axis (median along
+    # the other one) and the median difference inside tiles
+    if axis == 0:
+        luma = luma.T
+    right = luma[:, size::size]
+    left = luma[:, size - 1: size - 1 + size * right.shape[1]: size]
+    seams = np.median(np.abs(right - left), axis=0)
+    # a couple of thousand texels are plenty for the median inside tiles
+    steps = np.abs(np.diff(luma[::max(luma.size // 0x800, 1)], axis=1))
+    inside = steps[:, np.arange(steps.shape[1]) % size != size - 1]
+    return seams, float(np.median(inside)) if inside.size else 0.
+
+
+def scoreLayout(data, layout):
+    # scoreImage of the first rows of a (dataFormat, width, offset) guess, scaled
+    # down by scoreTiling when NumPy is there
+    dataFormat, width, offset = layout
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
+    height = min(getCandidateHeight(len(data), width, offset, dataFormat), finderScoreRows)
+    if height < bh * 2:                                                      # nothing to compare tile rows with
+        return 0.
+    # scored from RGBA32 whatever the output options are
+    pixelData = decodeRegion(memoryview(data)[offset:], width, height, dataFormat, 0, 0, width, height)
+    if np is None:
+        return scoreImage(pixelData, width, height)
+    return scoreTexels(np.frombuffer(pixelData, dtype=np.uint8).reshape(height, width, 4), bw, bh)
+
+
+def scoreTexels(texels, bw, bh):
+    # scoreImage of a (height, width, 4) uint8 texel array, scaled down when tile
+    # boundaries are rougher than the texels inside tiles, as they are for a
+    # wrong width or offset
+    if texels.shape[0] < bh * 2:
+        return 0.
+    score = scoreLuma(sumChannels(texels, 3))
+    luma = sumChannels(texels)
+    inside = across = 0.
+    for size, axis in ((bh, 0), (bw, 1)):
+        if luma.shape[axis] > size:
+            seams, median = getTileSeams(luma, size, axis)
+            inside += median
+            across += float(seams.mean())                                    # a single wrapped column counts too
+    return score * min(1., (inside + 1.) / (across + 1.))
+
+
+def scoreCandidate(candidate):
+    return scoreLayout(finderData, candidate), candidate
+
+
+def getTileSignal(data, dataFormat, phase):
+    # One value per 32-byte (64 for RGBA32) tile, following the tile's mean brightness
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
+    tileSize = bw * bh * bpp // 8
+    # the first 64K tiles hold dozens of rows of even the widest texture, plenty to find the row length
+    count = min((len(data) - phase) // tileSize, 0x10000)
+    tiles = np.frombuffer(data, dtype=np.uint8, count=count * tileSize, offset=phase).reshape(count, tileSize)
+
+    if dataFormat == NINTEX_CMPR:
+        tiles = tiles.reshape(count, 4, 8)[:, :, [0, 2]].reshape(count, -1)  # high bytes of the block endpoints
+    elif dataFormat == NINTEX_RGBA32:
+        tiles = tiles[:, 1:32:2]                                             # red
+    elif dataFormat == NINTEX_IA8:
+        tiles = tiles[:, 1::2]                                               # intensity
+    elif bpp == 16:
+        tiles = tiles[:, 0::2]                                               # high byte of each texel
+    elif dataFormat == NINTEX_IA4:
+        tiles = tiles & 0xF
+    elif bpp == 4:
+        tiles = (tiles >> 4) + (tiles & 0xF)
+    return tiles.sum(axis=1, dtype=np.uint32).astype(np.float32)
+
+
+def inferTextureLayouts(data, formats=None, count=None, minWidth=8, maxWidth=2048):
+    # Ranked (score, (dataFormat, width, offset)) guesses for a blob of tiled
+    # texture data, at most `count` per format.
+    # Edges in an image continue from one tile row to the next, so the tile to
+    # tile differences of the tile brightness signal correlate with themselves
+    # at a lag of exactly one tile row. The best lags of each phase are then
+    # decoded to find where the data starts and to rank them. Tiled data is
+    # assumed to start at a 32-byte boundary, as GX requires.
+    if np is None:
+        return []
+    formats = finderFormats if formats is None else formats
+    if formats is None:
+        formats = [x for x in dataFormats if not dataFormats[x][6]]
+    count = finderInferCount if count is None else count
+
+    data = bytes(data)
+    res = []
+    for dataFormat in formats:
         name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
-        if paletteLen:
-            continue
-            
-        height = ((bs.getSize() * 8) // (width * bpp)) & (~7)
-        texList.append(readTexture(bs, width, height, dataFormat))
-        texList[-1].name = name
+        tileSize = bw * bh * bpp // 8
+        layouts = {}
+        cache = {}
+        for phase in range(0, tileSize, 32):
+            signal = getTileSignal(data, dataFormat, phase)
+            # edges[i] is the step from tile i to tile i + 1
+            edges = np.diff(signal)
+            n = edges.size
+            lags = np.arange(max(minWidth // bw, 2), min(maxWidth // bw, n // 2 - 1) + 1)
+            if not lags.size:
+                continue
+            # keep noise such as headers and padding from drowning the image
+            limit = np.median(np.abs(edges)) * 4 + 1
+            np.clip(edges, -limit, limit, out=edges)
+            edges -= edges.mean()
+            variance = float((edges * edges).mean())
+            if variance < 1e-6:
+                continue
+
+            # autocorrelation through a zero-padded FFT
+            size = 1 << int(2 * n - 1).bit_length()
+            spectrum = np.fft.rfft(edges, size)
+            corr = np.fft.irfft(spectrum * np.conj(spectrum), size)[:n]
+            corr /= variance * (n - np.arange(n))
+
+            # a tile row stands out against lags one tile shorter or longer;
+            # multiples of it do too, the decoded score sorts them out
+            prominence = corr[lags] - np.maximum(corr[lags - 1], corr[lags + 1])
+            for i in np.argsort(-prominence)[:count * 2]:
+                width = int(lags[i]) * bw
+                start = getTileDataStart(data, dataFormat, width, phase, cache)
+                if start is not None:
+                    layouts[(dataFormat, width, start[0])] = start[1]
+
+        guesses = [(scoreTexels(layouts[x], bw, bh), x) for x in sorted(layouts)]
+        guesses.sort(key=lambda x: -x[0])
+        res += guesses[:count]
+
+    res.sort(key=lambda x: -x[0])
+    return res
+
+
+def decodeTexels(data, dataFormat, width, offset, cache):
+    # First rows of a guess as a (rows, width, 4) uint8 array, or None if there's no full tile row.
+    # Each guess is decoded once per inferTextureLayouts call, kept in cache by (width, offset).
+    key = (width, offset)
+    if key not in cache:
+        bh = dataFormats[dataFormat][4]
+        rows = min(max(finderInferTexels // width // bh, 4) * bh, finderScoreRows)
+        height = min(getCandidateHeight(len(data), width, offset, dataFormat), rows)
+        cache[key] = None
+        if height > 0:
+            pixelData = decodeRegion(memoryview(data)[offset:], width, height, dataFormat, 0, 0, width, height)
+            cache[key] = np.frombuffer(pixelData, dtype=np.uint8).reshape(height, width, 4)
+    return cache[key]
+
+
+def getPlaneSkew(data, dataFormat, width, offset, cache):
+    # How much the channels of a guess disagree about where tile columns break.
+    # Tiles bigger than 32 bytes (RGBA32) hold their channels in separate 32-byte
+    # planes, so starting a plane off pairs the channels of neighbouring tiles
+    # and only those channels wrap at the end of each tile row.
+    bw = dataFormats[dataFormat][3]
+    texels = decodeTexels(data, dataFormat, width, offset, cache)
+    if texels is None or width <= bw:
+        return 0.
+    # getTileSeams of all four channels at once
+    steps = np.abs(np.diff(texels.astype(np.int16), axis=1)).transpose(1, 0, 2)
+    sample = steps[:, ::max(steps.shape[1] * 4 // 0x2000, 1)]
+    inside = np.median(sample[np.arange(steps.shape[0]) % bw != bw - 1], axis=(0, 1))
+    seams = np.median(steps[bw - 1::bw], axis=1)
+    seams /= np.median(seams, axis=0) + inside + 1.
+    return float((seams.max(axis=1) - seams.min(axis=1)).max())
+
+
+def getTileDataStart(data, dataFormat, width, phase, cache, rowsFraction=0.5):
+    # (offset of the first tile, texels from there) of a guess of this width, starting the search
+    # at phase, or None if there's no full tile row.
+    # Decoded from too early, the tile rows wrap by the number of extra tiles, which
+    # shows as a seam at one tile column; whole rows of header before the data show
+    # as seams between the first tile rows.
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = dataFormats[dataFormat]
+    tileSize = bw * bh * bpp // 8
+    tilesX = width // bw
+    if tileSize > 32:
+        phase = min(range(max(phase - tileSize + 32, 0), phase + tileSize, 32),
+                    key=lambda x: getPlaneSkew(data, dataFormat, width, x, cache))
+
+    texels = decodeTexels(data, dataFormat, width, phase, cache)
+    if texels is None:
+        return None
+    column = 0
+    if tilesX > 1:
+        seams, inside = getTileSeams(sumChannels(texels), bw, 1)
+        best = int(np.argmax(seams))
+        rest = np.delete(seams, best)
+        typical = max(float(np.median(rest)) if rest.size else 0., inside, 1.)
+        if seams[best] > typical * 3:
+            column = best + 1
+
+    offset = phase + column * tileSize
+    texels = decodeTexels(data, dataFormat, width, offset, cache)
+    if texels is None:
+        return None
+    headerRows = 0
+    if texels.shape[0] > bh * 2:
+        seams, inside = getTileSeams(sumChannels(texels), bh, 0)
+        typical = max(float(np.median(seams)), inside, 1.)
+        odd = np.nonzero(seams[:max(int(seams.size * rowsFraction), 1)] > typical * 3)[0]
+        if odd.size:
+            headerRows = int(odd[-1]) + 1
+    # the rows after the header are the decode of the later offset
+    return offset + headerRows * tilesX * tileSize, texels[headerRows * bh:]
+
+
+def getFinderCandidates(size, widths=None, offsets=None, formats=None):
+    widths = finderWidths if widths is None else widths
+    offsets = finderOffsets if offsets is None else offsets
+    formats = finderFormats if formats is None else formats
+    if formats is None:
+        formats = [x for x in dataFormats if not dataFormats[x][6]]
+    return [(dataFormat, width, offset) for dataFormat in formats for width in widths for offset in offsets
+            if getCandidateHeight(size, width, offset, dataFormat) > 0]
+
+
+def scanTextures(data, candidates, workers=None):
+    # Scores of all candidates, best first
+    workers = finderWorkers if workers is None else workers
+    data = bytes(data)
+    scores = None
+
+    if workers > 0 and len(candidates) > 1 and canUseProcessPool():
+        try:
+            with ProcessPoolExecutor(workers, initializer=initFinderWorker, initargs=(data,)) as pool:
+                scores = list(pool.map(scoreCandidate, candidates, chunksize=max(len(candidates) // (workers * 4), 1)))
+        except (OSError, RuntimeError, BrokenProcessPool):
+            # embedded interpreters can't always spawn workers
+            disableProcessPool()
+            scores = None
+
+    if scores is None:
+        initFinderWorker(data)
+        scores = [scoreCandidate(x) for x in candidates]
+
+    # stable on ties so the order only depends on the candidate list
+    return sorted(scores, key=lambda x: -x[0])
+
+
+def nintexCheckType(data):
+    return len(data) >= 0x20
+
+
+def nintexLoadRGBA(data, texList):
+    # inferred layouts first, then the rest of the grid
+    candidates = [x for score, x in inferTextureLayouts(data)] if finderInfer else []
+    inferred = set(candidates)
+    candidates += [x for x in getFinderCandidates(len(data)) if x not in inferred]
+    for score, (dataFormat, width, offset) in scanTextures(data, candidates)[:finderTopN]:
+        height = getCandidateHeight(len(data), width, offset, dataFormat)
+        tex = convert(memoryview(data)[offset:], width, height, dataFormat)
+        tex.name = '{}_{}_{:#x}_{:.2f}'.format(dataFormats[dataFormat][0], width, offset, score)
+        texList.append(tex)
+
+    if finderRawDXT:
+        width = 256
+        height = (len(data) // width) & 0xFFFFFFFC
+        if height:
+            for name, pixelType in (("dxt1", noesis.NOESISTEX_DXT1), ("dxt3", noesis.NOESISTEX_DXT3),
+                                    ("dxt5", noesis.NOESISTEX_DXT5)):
+                texList.append(NoeTexture(name, width, height, bytes(data), pixelType))
 
     return len(texList)
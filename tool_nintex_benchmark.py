@@ -0,0 +1,247 @@
+# coding=utf-8
+
+# Benchmark tools for the Nintendo texture library by Zhenёq
+# https://github.com/Zheneq/Noesis-Plugins
+
+from inc_noesis import *
+import noesis
+import json
+import os
+import struct
+import sys
+import time
+import lib_zq_nintendo_tex as nintex
+import fmt_planet51_wii_s3t
+import fmt_silenthill_wii_tx
+import fmt_swtfu_wii_tex
+
+
+def registerNoesisTypes():
+    noesis.registerTool("Nintex CMPR Encoder Benchmark", benchmarkCMPRTool, "Measure CMPR encoding speed of each quality tier")
+    noesis.registerTool("Nintex Decoder Benchmark", benchmarkDecodersTool, "Measure decoding speed of each data format and check it against the reference decoder")
+    noesis.registerTool("Nintex Type Check Benchmark", benchmarkTypeChecksTool, "Measure noepyCheckType speed of the single-texture plugins")
+    return 1
+
+
+def syntheticImage(width, height):
+    # Deterministic RGBA32 test image: smooth gradients, edges, noise and some transparency
+    res = bytearray(width * height * 4)
+    seed = 0x1234567
+    for y in range(height):
+        for x in range(width):
+            seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+            noise = (seed >> 16) & 0xF
+            i = (y * width + x) * 4
+            res[i + 0] = (x * 255 // max(width - 1, 1)) ^ noise
+            res[i + 1] = (y * 255 // max(height - 1, 1)) ^ noise
+            res[i + 2] = 0xC0 if (x // 16 + y // 16) & 1 else 0x40
+            res[i + 3] = 0 if (x // 8 + y // 8) % 7 == 0 else 0xFF
+    return res
+
+
+def benchmarkCMPR(width=512, height=512, repeats=3):
+    # megapixels per second of each CMPR encoder tier
+    image = syntheticImage(width, height)
+    res = {}
+    for quality, name in ((nintex.NINTEX_CMPR_FAST, 'fast'), (nintex.NINTEX_CMPR_PCA, 'pca'), (nintex.NINTEX_CMPR_REFINE, 'refine')):
+        start = time.perf_counter()
+        for i in range(repeats):
+            nintex.encodeCMPR(image, width, height, quality)
+        res[name] = width * height * repeats / 1e6 / (time.perf_counter() - start)
+    return res
+
+
+def benchmarkCMPRTool(toolIndex):
+    noesis.logPopup()
+    for name, speed in benchmarkCMPR().items():
+        print('CMPR {}: {:.2f} MP/s'.format(name, speed))
+    return 0
+
+
+def syntheticData(size, seed=1):
+    # Deterministic pseudo-random bytes, stand-in for raw texture data
+    res = bytearray(size)
+    for i in range(size):
+        seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+        res[i] = seed >> 16 & 0xFF
+    return res
+
+
+def referenceDecode(buffer, width, height, dataFormat, palette=None, pixelFormat=None):
+    # RGBA32 data decoded texel by texel with pixelParser; the baseline the fast decoders are checked against.
+    # CMPR has no per-texel decoder, so the scalar textureParser.cmpr stands in.
+    name, decoder, bpp, bw, bh, bSimple, paletteLen = nintex.dataFormats[dataFormat]
+    size = nintex.getTextureSizeInBytes(width, height, dataFormat)
+    buffer = bytes(buffer[:size]) + bytes(max(size - len(buffer), 0))
+    tilesX = nintex.getStorageWH(width, height, dataFormat)[0] // bw
+
+    if dataFormat == nintex.NINTEX_CMPR:
+        return bytearray(nintex.textureParser.cmpr(buffer, width, height).pixelData)
+
+    def raw(x, y):
+        # value of texel x, y in its tile
+        tile = (y // bh * tilesX + x // bw) * bw * bh
+        i = (y % bh) * bw + x % bw
+        if bpp == 32:
+            off = tile * 4 + i * 2
+            return buffer[off + 1] << 24 | buffer[off + 32] << 16 | buffer[off + 33] << 8 | buffer[off]
+        elif bpp == 16:
+            return buffer[(tile + i) * 2] << 8 | buffer[(tile + i) * 2 + 1]
+        elif bpp == 8:
+            return buffer[tile + i]
+        return (buffer[(tile + i) // 2] >> (0 if i & 1 else 4)) & 0xF
+
+    if dataFormat == nintex.NINTEX_RGBA32:
+        decoder = nintex.pixelParser.rgba32
+    elif paletteLen:
+        if palette is None:
+            raise ValueError("Palette is required for format " + name)
+        entryDecoder = nintex.dataFormats[nintex.pixelFormats[pixelFormat]][1]
+        count = len(palette) // 2
+        def decoder(index):
+            index &= 0x3FFF
+            if index >= count:
+                return bytes(4)
+            return entryDecoder(palette[index * 2] << 8 | palette[index * 2 + 1])
+
+    res = bytearray(width * height * 4)
+    for y in range(height):
+        for x in range(width):
+            res[(y * width + x) * 4: (y * width + x + 1) * 4] = decoder(raw(x, y))
+    return res
+
+
+def timeCall(repeats, func, *args):
+    # seconds per call
+    start = time.perf_counter()
+    for i in range(repeats):
+        func(*args)
+    return (time.perf_counter() - start) / repeats
+
+
+benchmarkSizes = ((64, 64), (256, 256), (512, 512), (37, 29), (250, 130))
+
+
+def benchmarkDecoders(sizes=benchmarkSizes, repeats=3, formats=None, path=None, check=True):
+    # Time convert, unswizzle, crop and encode of synthetic textures of every data format
+    # and compare convert against referenceDecode. Speeds are in megapixels per second.
+    # The report is written to path as JSON if given.
+    savedOptions = nintex.cmprAsDXT1, nintex.opaqueAsRGB24
+    nintex.cmprAsDXT1 = nintex.opaqueAsRGB24 = 0
+    results = []
+    try:
+        for dataFormat in sorted(nintex.dataFormats if formats is None else formats):
+            name, decoder, bpp, bw, bh, bSimple, paletteLen = nintex.dataFormats[dataFormat]
+            palette = bytes(syntheticData(paletteLen * 2, dataFormat + 1)) if paletteLen else None
+            pixelFormat = 2 if paletteLen else None
+
+            for width, height in sizes:
+                mp = width * height / 1e6
+                _width, _height = nintex.getStorageWH(width, height, dataFormat)
+                src = bytes(syntheticData(nintex.getTextureSizeInBytes(width, height, dataFormat), width ^ height))
+                res = {'format': name, 'width': width, 'height': height}
+
+                textureData = nintex.convert(src, width, height, dataFormat, palette, pixelFormat).pixelData
+                res['convert'] = mp / timeCall(repeats, nintex.convert, src, width, height, dataFormat, palette, pixelFormat)
+                res['unswizzle'] = None
+                if dataFormat not in (nintex.NINTEX_RGBA32, nintex.NINTEX_CMPR):
+                    res['unswizzle'] = mp / timeCall(repeats, nintex.unswizzle, src, width, height, dataFormat)
+                padded = bytes(_width * _height * 4)
+                res['crop'] = mp / timeCall(repeats, nintex.crop, padded, _width, _height, 32, width, height)
+
+                try:
+                    res['encode'] = mp / timeCall(repeats, nintex.encode, textureData, width, height, dataFormat, palette, pixelFormat)
+                except ValueError:
+                    res['encode'] = None
+
+                res['match'] = None
+                if check:
+                    res['match'] = bytes(textureData) == bytes(referenceDecode(src, width, height, dataFormat, palette, pixelFormat))
+                results.append(res)
+    finally:
+        nintex.cmprAsDXT1, nintex.opaqueAsRGB24 = savedOptions
+
+    report = {
+        'version': nintex.NINTEX_VERSION,
+        'python': sys.version.split()[0],
+        'numpy': None if nintex.np is None else nintex.np.__version__,
+        'repeats': repeats,
+        'results': results,
+    }
+    if path is not None:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=1)
+    return report
+
+
+def benchmarkDecodersTool(toolIndex):
+    noesis.logPopup()
+    path = os.path.join(noesis.getScenesPath(), 'nintex_benchmark.json')
+    report = benchmarkDecoders(path=path)
+    speed = lambda x: '-' if x is None else '{:.2f}'.format(x)
+    for res in report['results']:
+        print('{format} {width}x{height}: convert {0}, unswizzle {1}, crop {2}, encode {3} MP/s{4}'.format(
+            speed(res['convert']), speed(res['unswizzle']), speed(res['crop']), speed(res['encode']),
+            '' if res['match'] else ' MISMATCH', **res))
+    print('Saved to ' + path)
+    return 0
+
+
+# plugins whose noepyCheckType the type check benchmark runs, and an optional folder of files to run it on
+typeCheckPlugins = (fmt_planet51_wii_s3t, fmt_swtfu_wii_tex, fmt_silenthill_wii_tx)
+typeCheckCorpusPath = None
+
+
+def syntheticCorpus(count=3000):
+    # Mixed stand-in for a folder of files: random data of many sizes (a few of them large),
+    # headers that look like the plugins' formats, valid or not, and empty files
+    noise = bytes(syntheticData(0x100000, 25))
+    res = []
+    for i in range(count):
+        kind = i % 10
+        size = (i * 2654435761) % 0x4000
+        if kind == 0:
+            size = 0x100000 - i % 0x1000
+        data = bytearray(noise[i % 0x1000: i % 0x1000 + size])
+        if kind in (1, 2, 3) and len(data) >= 0x90:
+            # plausible format codes and sizes in the header fields the plugins look at
+            width, height = 8 << (i % 8), 8 << (i // 8 % 8)
+            struct.pack_into('>IIII', data, 0, (0x0E, 0x4C, 0x05)[kind - 1], width, height, size - 0x20)
+            struct.pack_into('>HHBBBBII', data, 0x80, width, height, 0, 1, (0x0E, 0x04, 0x0A)[kind - 1], 0, 0, size - 0x90)
+        elif kind == 4:
+            data = bytearray()
+        res.append(bytes(data))
+    return res
+
+
+def benchmarkTypeChecks(checks, corpus, repeats=3):
+    # name: (files per second, accepted files) of each type check function
+    res = {}
+    for name, check in checks:
+        start = time.perf_counter()
+        for i in range(repeats):
+            accepted = 0
+            for data in corpus:
+                try:
+                    accepted += bool(check(data))
+                except Exception:
+                    pass
+        res[name] = (len(corpus) * repeats / (time.perf_counter() - start), accepted)
+    return res
+
+
+def benchmarkTypeChecksTool(toolIndex):
+    noesis.logPopup()
+    if typeCheckCorpusPath:
+        corpus = []
+        for root, dirs, files in os.walk(typeCheckCorpusPath):
+            for name in files:
+                with open(os.path.join(root, name), 'rb') as f:
+                    corpus.append(f.read())
+    else:
+        corpus = syntheticCorpus()
+
+    checks = [(x.__name__, x.noepyCheckType) for x in typeCheckPlugins]
+    for name, (speed, accepted) in benchmarkTypeChecks(checks, corpus).items():
+        print('{}: {:.0f} files/s, {} of {} accepted'.format(name, speed, accepted, len(corpus)))
+    return 0